@@ -4,7 +4,11 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
+import time
+from contextlib import contextmanager
 import warnings
+from comparacion import CONTAINER_SIZES
+import consultas
 warnings.filterwarnings('ignore')
 
 # Configuración de la página
@@ -15,44 +19,217 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Función para cargar datos
-@st.cache_data
+# Figuras de Plotly cacheadas por versión de datos y estado de los filtros. cache_resource
+# devuelve el mismo objeto en cada rerun (sin copiarlo), así solo queda serializarlo al dibujar.
+# max_entries acota cada caché: al cambiar los datos, las figuras de versiones viejas se descartan
+# en lugar de acumularse mientras viva el proceso.
+@st.cache_resource(show_spinner=False, max_entries=8)
+def provider_pie_figure(_chart_model, version, size):
+    provider_counts = _chart_model['sizes'][size]['best_counts']
+    fig = px.pie(
+        values=provider_counts.values,
+        names=provider_counts.index,
+        title=f"Distribución de Mejores Precios - Contenedor {size}'"
+    )
+    fig.update_traces(
+        textposition='inside',
+        textinfo='percent+label',
+        textfont=dict(size=24)
+    )
+    fig.update_layout(showlegend=False)
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def scatter_figure(_chart_model, version):
+    fig = make_subplots(
+        rows=1, cols=2,
+        subplot_titles=('Contenedor 20\'', 'Contenedor 40\''),
+        specs=[[{"secondary_y": False}, {"secondary_y": False}]]
+    )
+
+    # Scatter plot por tamaño de contenedor, con el hover ya armado en el chart model
+    for col, (size, color) in enumerate(zip(CONTAINER_SIZES, ['blue', 'red']), start=1):
+        scatter_df = _chart_model['sizes'][size]['valid']
+        fig.add_trace(
+            go.Scatter(
+                x=scatter_df[f'best_price_{size}'],
+                y=scatter_df[f'price_diff_{size}_pct'],
+                mode='markers',
+                name=f"{size}'",
+                text=_chart_model['sizes'][size]['hover'],
+                hovertemplate='<b>%{text}</b><br>Mejor Precio: $%{x}<br>Diferencia: %{y:.1f}%<extra></extra>',
+                marker=dict(size=8, color=color, opacity=0.6)
+            ),
+            row=1, col=col
+        )
+
+    fig.update_xaxes(title_text="Mejor Precio (USD)", row=1, col=1)
+    fig.update_xaxes(title_text="Mejor Precio (USD)", row=1, col=2)
+    fig.update_yaxes(title_text="Diferencia de Precio (%)", row=1, col=1)
+    fig.update_yaxes(title_text="Diferencia de Precio (%)", row=1, col=2)
+
+    fig.update_layout(
+        title="Relación entre Precio Base y Diferencia Porcentual",
+        height=500,
+        showlegend=False
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=4)
+def avg_prices_figure(_chart_model, version):
+    return px.bar(
+        _chart_model['avg_prices'].melt(id_vars=['Proveedor'],
+                                        value_vars=['Promedio 20\'', 'Promedio 40\''],
+                                        var_name='Tipo Contenedor', value_name='Precio Promedio'),
+        x='Proveedor',
+        y='Precio Promedio',
+        color='Tipo Contenedor',
+        title="Comparación de Precios Promedio por Proveedor",
+        barmode='group'
+    )
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def source_pie_figure(_source_dist, version, port_filter, fuente):
+    return px.pie(
+        values=_source_dist.values,
+        names=_source_dist.index,
+        title="Destinos Únicos por Fuente"
+    )
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def trend_figure(_trend_view, version, port, size):
+    # Promedio mensual por proveedor, con la banda entre el mínimo y el máximo del mes
+    fig = go.Figure()
+    colors = px.colors.qualitative.Plotly
+    for i, (proveedor, serie) in enumerate(_trend_view.groupby('Proveedor', sort=False)):
+        color = colors[i % len(colors)]
+        fig.add_trace(go.Scatter(
+            x=np.concatenate([serie['Mes'], serie['Mes'][::-1]]),
+            y=np.concatenate([serie['Máximo'], serie['Mínimo'][::-1]]),
+            fill='toself', fillcolor=color, opacity=0.15, line=dict(width=0),
+            hoverinfo='skip', showlegend=False, legendgroup=proveedor
+        ))
+        fig.add_trace(go.Scatter(
+            x=serie['Mes'], y=serie['Promedio'], mode='lines+markers', name=proveedor,
+            line=dict(color=color), legendgroup=proveedor,
+            customdata=serie[['Mínimo', 'Máximo']],
+            hovertemplate='%{x|%m/%Y}<br>Promedio: $%{y:,.0f}<br>Mín: $%{customdata[0]:,.0f} · Máx: $%{customdata[1]:,.0f}'
+        ))
+    fig.update_layout(
+        title=f"Evolución de Precios - {port} - Contenedor {size}'",
+        xaxis_title="Mes",
+        yaxis_title="Precio (USD)",
+        height=500,
+        hovermode='x unified'
+    )
+    return fig
+
+# Tiempo de cada pestaña en este rerun; se muestra en la barra lateral
+render_times = {}
+
+@contextmanager
+def timed(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        render_times[name] = time.perf_counter() - start
+
+# Función para cargar datos; la lectura y los agregados se comparten entre sesiones (consultas.py)
 def load_data():
     try:
-        comparison_df = pd.read_csv('data/price_comparison.csv')
-        no_matches_df = pd.read_csv('data/no_matches.csv')
-        summary_stats = pd.read_csv('data/summary_statistics.csv', index_col=0)
-        airesds_df = pd.read_csv('data/airesds_data.csv')
-        exim_df = pd.read_csv('data/exim_data.csv')
-        silver_df = pd.read_csv('data/silver_data.csv')
-        
-        return comparison_df, no_matches_df, summary_stats, airesds_df, exim_df, silver_df
+        return consultas.load_data()
     except FileNotFoundError as e:
         st.error(f"Error: No se pudieron cargar los datos. Asegúrate de ejecutar comparacion.py primero. {e}")
         st.stop()
 
 # Cargar datos
-comparison_df, no_matches_df, summary_stats, airesds_df, exim_df, silver_df = load_data()
+data = load_data()
+comparison_df, no_matches_df, summary_stats = data['comparison'], data['no_matches'], data['summary']
+providers, provider_dfs = data['providers'], data['provider_frames']
+data_info = {key: data[key] for key in ['version', 'updated', 'load_seconds']}
+port_index = consultas.port_index(data)
+chart_model = consultas.chart_model(data)
 
 # Título principal
 st.title("🚢 Dashboard de Comparación de Precios Marítimos")
-st.markdown("### Análisis comparativo de precios entre AiresDS, EXIM y Silver")
-
-# Crear tabs
-tab1, tab2, tab3, tab4, tab5 = st.tabs([
-    "Comparación de Precios",
-    "Resumen", 
-    "Análisis por Proveedor", 
-    "Destinos sin Coincidencias",
-    "Datos Detallados"
-])
-
-with tab1:
+provider_names = [p['name'] for p in providers]
+st.markdown(f"### Análisis comparativo de precios entre {', '.join(provider_names[:-1])} y {provider_names[-1]}")
+st.caption(
+    f"Versión de datos {data_info['version']} · generados {time.strftime('%d/%m/%Y %H:%M', time.localtime(data_info['updated']))}"
+    f" · carga {data_info['load_seconds'] * 1000:.0f} ms"
+)
+
+# Opciones de paginación de los destinos de un puerto
+PAGE_SIZES = [10, 25, 50, 100]
+
+def money_fmt(val):
+    if pd.isna(val):
+        return "N/A"
+    return "${:,.0f}".format(val).replace(",", ".")
+
+def money_fmt_series(values):
+    # Igual que money_fmt, pero para una columna entera sin recorrer fila por fila
+    whole = values.astype(float).round().astype('Int64').astype('string')
+    return ('$' + whole.str.replace(r'\B(?=(\d{3})+(?!\d))', '.', regex=True)).fillna("N/A")
+
+def compact_table(df):
+    # Una fila por destino con el mejor proveedor y los precios de cada proveedor
+    table = pd.DataFrame({"Destino": df['destino']})
+    if 'port_code' in df.columns:
+        table["Puerto"] = df['port_code']
+    for size in CONTAINER_SIZES:
+        table[f"Mejor {size}'"] = df[f'best_provider_{size}'].astype(object).fillna("N/A")
+        table[f"Precio {size}'"] = money_fmt_series(df[f'best_price_{size}'])
+    for p in providers:
+        for size in CONTAINER_SIZES:
+            table[f"{p['name']} {size}'"] = money_fmt_series(df[f"{p['key']}_{size}"])
+    return table
+
+def show_destination(row, title):
+    with st.expander(title, expanded=True):
+        # Score cards: Mejor proveedor y precios
+        col1, col2, col3 = st.columns(3)
+
+        # Mejor proveedor 20'
+        with col1:
+            st.markdown("**Contenedor 20'**")
+            st.metric(
+                label="Mejor Proveedor",
+                value=row['best_provider_20'].capitalize() if pd.notna(row['best_provider_20']) else "N/A"
+            )
+            st.metric(
+                label="Precio",
+                value=money_fmt(row['best_price_20'])
+            )
+
+        # Mejor proveedor 40'
+        with col2:
+            st.markdown("**Contenedor 40'**")
+            st.metric(
+                label="Mejor Proveedor",
+                value=row['best_provider_40'].capitalize() if pd.notna(row['best_provider_40']) else "N/A"
+            )
+            st.metric(
+                label="Precio",
+                value=money_fmt(row['best_price_40'])
+            )
+
+        # Precios por proveedor
+        with col3:
+            st.markdown("**Precios por Proveedor**")
+            precios_data = {"Proveedor": provider_names}
+            for size in CONTAINER_SIZES:
+                precios_data[f"{size}'"] = [money_fmt(row[f"{p['key']}_{size}"]) for p in providers]
+            precios_df = pd.DataFrame(precios_data)
+            st.table(precios_df)
+
+def render_comparacion():
     st.header("Comparación de Precios")
 
     # Port code filter
     if not comparison_df.empty and 'port_code' in comparison_df.columns:
-        available_ports = sorted([code for code in comparison_df['port_code'].unique() if pd.notna(code) and code != ""])
+        available_ports = port_index['ports']
         
         col1, col2 = st.columns(2)
         
@@ -66,19 +243,21 @@ with tab1:
         with col2:
             # Filter dataframe based on port selection
             if port_filter != "Todos los puertos":
-                filtered_comparison_df = comparison_df[comparison_df['port_code'] == port_filter]
+                filtered_comparison_df = comparison_df.iloc[port_index['rows'][port_filter]]
+                destinos_disponibles = port_index['destinos'][port_filter]
             else:
                 filtered_comparison_df = comparison_df
-            
-            destinos_disponibles = sorted(filtered_comparison_df['destino'].unique().tolist())
+                destinos_disponibles = port_index['all_destinos']
+
             search_destino = st.selectbox(
                 "Seleccionar destino para comparar precios:",
                 options=["Seleccione un destino..."] + destinos_disponibles,
                 index=0
             )
     else:
+        port_filter = "Todos los puertos"
         filtered_comparison_df = comparison_df
-        destinos_disponibles = sorted(comparison_df['destino'].unique().tolist()) if not comparison_df.empty else []
+        destinos_disponibles = port_index['all_destinos']
         search_destino = st.selectbox(
             "Seleccionar destino para comparar precios:",
             options=["Seleccione un destino..."] + destinos_disponibles,
@@ -87,109 +266,40 @@ with tab1:
     
     # Show results for both port filter and destination selection
     if port_filter != "Todos los puertos" and search_destino == "Seleccione un destino...":
-        # Show all destinations for selected port with individual summaries
+        # Show the destinations of the selected port, one page at a time
         if not filtered_comparison_df.empty:
             st.subheader(f"Código de puerto {port_filter}")
-            
-            def money_fmt(val):
-                if pd.isna(val):
-                    return "N/A"
-                return "${:,.0f}".format(val).replace(",", ".")
-            
-            # Show each destination in the port
-            for idx, row in filtered_comparison_df.iterrows():
-                with st.expander(f"📍 {row['destino']}", expanded=True):
-                    # Score cards: Mejor proveedor y precios
-                    col1, col2, col3 = st.columns(3)
-                    
-                    # Mejor proveedor 20'
-                    with col1:
-                        st.markdown("**Contenedor 20'**")
-                        st.metric(
-                            label="Mejor Proveedor",
-                            value=row['best_provider_20'].capitalize() if pd.notna(row['best_provider_20']) else "N/A"
-                        )
-                        st.metric(
-                            label="Precio",
-                            value=money_fmt(row['best_price_20'])
-                        )
-
-                    # Mejor proveedor 40'
-                    with col2:
-                        st.markdown("**Contenedor 40'**")
-                        st.metric(
-                            label="Mejor Proveedor",
-                            value=row['best_provider_40'].capitalize() if pd.notna(row['best_provider_40']) else "N/A"
-                        )
-                        st.metric(
-                            label="Precio",
-                            value=money_fmt(row['best_price_40'])
-                        )
-
-                    # Precios por proveedor
-                    with col3:
-                        st.markdown("**Precios por Proveedor**")
-                        precios_data = {
-                            "Proveedor": ["AiresDS", "EXIM", "Silver"],
-                            "20'": [money_fmt(row['aires_20']), money_fmt(row['fcl_20']), money_fmt(row['silver_20'])],
-                            "40'": [money_fmt(row['aires_40']), money_fmt(row['fcl_40']), money_fmt(row['silver_40'])]
-                        }
-                        precios_df = pd.DataFrame(precios_data)
-                        st.table(precios_df)
+
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                vista = st.radio("Vista:", options=["Tarjetas", "Tabla compacta"], horizontal=True, key="vista_puerto")
+            with col2:
+                page_size = st.selectbox("Destinos por página:", options=PAGE_SIZES, key="page_size_puerto")
+            total_pages = max(1, -(-len(filtered_comparison_df) // page_size))
+            with col3:
+                # Una clave por puerto: al cambiar de puerto se vuelve a la primera página
+                page = st.number_input("Página:", min_value=1, max_value=total_pages, value=1, step=1,
+                                       key=f"page_{port_filter}_{page_size}")
+
+            page_df = filtered_comparison_df.iloc[(page - 1) * page_size:page * page_size]
+            st.caption(f"Mostrando {len(page_df)} de {len(filtered_comparison_df)} destinos · página {page} de {total_pages}")
+
+            if vista == "Tabla compacta":
+                st.dataframe(compact_table(page_df), width='stretch', hide_index=True)
+            else:
+                for _, row in page_df.iterrows():
+                    show_destination(row, f"📍 {row['destino']}")
         else:
             st.info(f"No se encontraron destinos para el puerto {port_filter}")
     
     elif search_destino != "Seleccione un destino...":
-        search_results = filtered_comparison_df[filtered_comparison_df['destino'] == search_destino]
-        if not search_results.empty:
-            row = search_results.iloc[0]
+        row_position = port_index['destino_row'].get(search_destino)
+        if row_position is not None:
+            row = comparison_df.iloc[row_position]
             
             # Display port code if available
             port_code_display = f" ({row['port_code']})" if 'port_code' in row and pd.notna(row['port_code']) and row['port_code'] else ""
-            
-            with st.expander(f"📍 {search_destino}{port_code_display}", expanded=True):
-                # Score cards: Mejor proveedor y precios
-                col1, col2, col3 = st.columns(3)
-
-                def money_fmt(val):
-                    if pd.isna(val):
-                        return "N/A"
-                    return "${:,.0f}".format(val).replace(",", ".")
-                
-                # Mejor proveedor 20'
-                with col1:
-                    st.markdown("**Contenedor 20'**")
-                    st.metric(
-                        label="Mejor Proveedor",
-                        value=row['best_provider_20'].capitalize() if pd.notna(row['best_provider_20']) else "N/A"
-                    )
-                    st.metric(
-                        label="Precio",
-                        value=money_fmt(row['best_price_20'])
-                    )
-
-                # Mejor proveedor 40'
-                with col2:
-                    st.markdown("**Contenedor 40'**")
-                    st.metric(
-                        label="Mejor Proveedor",
-                        value=row['best_provider_40'].capitalize() if pd.notna(row['best_provider_40']) else "N/A"
-                    )
-                    st.metric(
-                        label=" Precio",
-                        value=money_fmt(row['best_price_40'])
-                    )
-
-                # Precios por proveedor
-                with col3:
-                    st.markdown("**Precios por Proveedor**")
-                    precios_data = {
-                        "Proveedor": ["AiresDS", "EXIM", "Silver"],
-                        "20'": [money_fmt(row['aires_20']), money_fmt(row['fcl_20']), money_fmt(row['silver_20'])],
-                        "40'": [money_fmt(row['aires_40']), money_fmt(row['fcl_40']), money_fmt(row['silver_40'])]
-                    }
-                    precios_df = pd.DataFrame(precios_data)
-                    st.table(precios_df)
+            show_destination(row, f"📍 {search_destino}{port_code_display}")
 
         else:
             st.info("No se encontraron destinos que coincidan con la búsqueda.")
@@ -197,7 +307,7 @@ with tab1:
     else:
         st.info("Seleccione un puerto o destino para ver la comparación de precios.")
 
-with tab2:
+def render_resumen():
     st.header("Resumen")
     
     # Métricas principales
@@ -211,390 +321,233 @@ with tab2:
         destinos_sin_match = len(no_matches_df) if not no_matches_df.empty else 0
         st.metric("Destinos sin Coincidencias", destinos_sin_match)
     
-    with col3:
-        if not comparison_df.empty and 'price_diff_20_pct' in comparison_df.columns:
-            # Filter out infinite values
-            valid_diffs = comparison_df['price_diff_20_pct'].replace([np.inf, -np.inf], np.nan).dropna()
-            if len(valid_diffs) > 0:
-                avg_diff = valid_diffs.mean()
-                st.metric("Diferencia Promedio (%)", f"{avg_diff:.1f}%")
+    for col, label, stat in [(col3, "Diferencia Promedio (%)", 'avg_diff'), (col4, "Diferencia Máxima (%)", 'max_diff')]:
+        with col:
+            if not comparison_df.empty and '20' in chart_model['sizes']:
+                st.metric(label, f"{chart_model['sizes']['20'][stat]:.1f}%")
             else:
-                st.metric("Diferencia Promedio (%)", "0.0%")
-        else:
-            st.metric("Diferencia Promedio (%)", "N/A")
-    
-    with col4:
-        if not comparison_df.empty and 'price_diff_20_pct' in comparison_df.columns:
-            # Filter out infinite values
-            valid_diffs = comparison_df['price_diff_20_pct'].replace([np.inf, -np.inf], np.nan).dropna()
-            if len(valid_diffs) > 0:
-                max_diff = valid_diffs.max()
-                st.metric("Diferencia Máxima (%)", f"{max_diff:.1f}%")
-            else:
-                st.metric("Diferencia Máxima (%)", "0.0%")
-        else:
-            st.metric("Diferencia Máxima (%)", "N/A")
+                st.metric(label, "N/A")
 
     col1, col2 = st.columns(2)
     
-    with col1:
-        st.subheader("Mejores Precios por Proveedor (Contenedor 20')")
-        provider_counts_20 = comparison_df['best_provider_20'].value_counts()
-        
-        fig_provider_20 = px.pie(
-            values=provider_counts_20.values,
-            names=provider_counts_20.index,
-            title="Distribución de Mejores Precios - Contenedor 20'"
-        )
-        fig_provider_20.update_traces(
-            textposition='inside',
-            textinfo='percent+label',
-            textfont=dict(size=24)
-        )
-        fig_provider_20.update_layout(showlegend=False)
-        st.plotly_chart(fig_provider_20, use_container_width=True)
-    
-    with col2:
-        st.subheader("Mejores Precios por Proveedor (Contenedor 40')")
-        provider_counts_40 = comparison_df['best_provider_40'].value_counts()
-        
-        fig_provider_40 = px.pie(
-            values=provider_counts_40.values,
-            names=provider_counts_40.index,
-            title="Distribución de Mejores Precios - Contenedor 40'"
-        )
-        fig_provider_40.update_traces(
-            textposition='inside',
-            textinfo='percent+label',
-            textfont=dict(size=24)
-        )
-        fig_provider_40.update_layout(showlegend=False)
-        st.plotly_chart(fig_provider_40, use_container_width=True)
+    for col, size in zip([col1, col2], CONTAINER_SIZES):
+        with col:
+            st.subheader(f"Mejores Precios por Proveedor (Contenedor {size}')")
+            st.plotly_chart(provider_pie_figure(chart_model, data_info['version'], size), width='stretch')
 
     # Top 10 diferencias más grandes
     st.subheader("Top 10 Destinos con Mayores Diferencias de Precio")
     
     col1, col2 = st.columns(2)
     
-    with col1:
-        st.write("**Contenedor 20'**")
-        # Filter out infinite values before getting top differences
-        filtered_df_20 = comparison_df[comparison_df['price_diff_20_pct'].replace([np.inf, -np.inf], np.nan).notna()]
-        if not filtered_df_20.empty:
-            top_diff_20 = filtered_df_20.nlargest(10, 'price_diff_20_pct')[
-                ['destino', 'port_code', 'best_price_20', 'worst_price_20', 'price_diff_20_pct', 'best_provider_20']
-            ].round(2)
-            top_diff_20.columns = ['Destino', 'Puerto', 'Mejor Precio', 'Peor Precio', 'Diferencia %', 'Mejor Proveedor']
-            st.dataframe(top_diff_20, use_container_width=True)
-        else:
-            st.info("No hay datos válidos para mostrar")
-    
-    with col2:
-        st.write("**Contenedor 40'**")
-        # Filter out infinite values before getting top differences
-        filtered_df_40 = comparison_df[comparison_df['price_diff_40_pct'].replace([np.inf, -np.inf], np.nan).notna()]
-        if not filtered_df_40.empty:
-            top_diff_40 = filtered_df_40.nlargest(10, 'price_diff_40_pct')[
-                ['destino', 'port_code', 'best_price_40', 'worst_price_40', 'price_diff_40_pct', 'best_provider_40']
-            ].round(2)
-            top_diff_40.columns = ['Destino', 'Puerto', 'Mejor Precio', 'Peor Precio', 'Diferencia %', 'Mejor Proveedor']
-            st.dataframe(top_diff_40, use_container_width=True)
-        else:
-            st.info("No hay datos válidos para mostrar")
+    for col, size in zip([col1, col2], CONTAINER_SIZES):
+        with col:
+            st.write(f"**Contenedor {size}'**")
+            # Infinite values are already filtered out in the chart model
+            if not chart_model['sizes'][size]['valid'].empty:
+                st.dataframe(chart_model['sizes'][size]['top'], width='stretch')
+            else:
+                st.info("No hay datos válidos para mostrar")
 
     st.subheader("Análisis de Dispersión de Precios")
     
-    fig_scatter = make_subplots(
-        rows=1, cols=2,
-        subplot_titles=('Contenedor 20\'', 'Contenedor 40\''),
-        specs=[[{"secondary_y": False}, {"secondary_y": False}]]
-    )
-    
-    # Filter out infinite values for scatter plots
-    scatter_df_20 = comparison_df[comparison_df['price_diff_20_pct'].replace([np.inf, -np.inf], np.nan).notna()]
-    scatter_df_40 = comparison_df[comparison_df['price_diff_40_pct'].replace([np.inf, -np.inf], np.nan).notna()]
-    
-    # Create hover text with port codes
-    hover_text_20 = []
-    hover_text_40 = []
-    for _, row in scatter_df_20.iterrows():
-        port_info = f" ({row['port_code']})" if 'port_code' in row and pd.notna(row['port_code']) and row['port_code'] else ""
-        hover_text_20.append(f"{row['destino']}{port_info}")
-    
-    for _, row in scatter_df_40.iterrows():
-        port_info = f" ({row['port_code']})" if 'port_code' in row and pd.notna(row['port_code']) and row['port_code'] else ""
-        hover_text_40.append(f"{row['destino']}{port_info}")
-    
-    # Scatter plot para 20'
-    fig_scatter.add_trace(
-        go.Scatter(
-            x=scatter_df_20['best_price_20'],
-            y=scatter_df_20['price_diff_20_pct'],
-            mode='markers',
-            name='20\'',
-            text=hover_text_20,
-            hovertemplate='<b>%{text}</b><br>Mejor Precio: $%{x}<br>Diferencia: %{y:.1f}%<extra></extra>',
-            marker=dict(size=8, color='blue', opacity=0.6)
-        ),
-        row=1, col=1
-    )
-    
-    # Scatter plot para 40'
-    fig_scatter.add_trace(
-        go.Scatter(
-            x=scatter_df_40['best_price_40'],
-            y=scatter_df_40['price_diff_40_pct'],
-            mode='markers',
-            name='40\'',
-            text=hover_text_40,
-            hovertemplate='<b>%{text}</b><br>Mejor Precio: $%{x}<br>Diferencia: %{y:.1f}%<extra></extra>',
-            marker=dict(size=8, color='red', opacity=0.6)
-        ),
-        row=1, col=2
-    )
-    
-    fig_scatter.update_xaxes(title_text="Mejor Precio (USD)", row=1, col=1)
-    fig_scatter.update_xaxes(title_text="Mejor Precio (USD)", row=1, col=2)
-    fig_scatter.update_yaxes(title_text="Diferencia de Precio (%)", row=1, col=1)
-    fig_scatter.update_yaxes(title_text="Diferencia de Precio (%)", row=1, col=2)
-    
-    fig_scatter.update_layout(
-        title="Relación entre Precio Base y Diferencia Porcentual",
-        height=500,
-        showlegend=False
-    )
-    
-    st.plotly_chart(fig_scatter, use_container_width=True)
+    st.plotly_chart(scatter_figure(chart_model, data_info['version']), width='stretch')
 
-with tab3:
+def render_proveedores():
     st.header("Análisis por Proveedor")
     
     if not comparison_df.empty:
         # Comparación de precios promedio por proveedor
         st.subheader("Precios Promedio por Proveedor")
         
-        # Calcular precios promedio
-        avg_prices_data = []
-        
-        for provider in ['aires', 'fcl', 'silver']:
-            col_20 = f'{provider}_20'
-            col_40 = f'{provider}_40'
-            
-            if col_20 in comparison_df.columns and col_40 in comparison_df.columns:
-                avg_20 = comparison_df[col_20].mean()
-                avg_40 = comparison_df[col_40].mean()
-                
-                avg_prices_data.append({
-                    'Proveedor': provider.capitalize(),
-                    'Promedio 20\'': avg_20,
-                    'Promedio 40\'': avg_40
-                })
-        
-        if avg_prices_data:
-            avg_prices_df = pd.DataFrame(avg_prices_data)
-            
-            fig_avg = px.bar(
-                avg_prices_df.melt(id_vars=['Proveedor'], 
-                                   value_vars=['Promedio 20\'', 'Promedio 40\''],
-                                   var_name='Tipo Contenedor', value_name='Precio Promedio'),
-                x='Proveedor',
-                y='Precio Promedio',
-                color='Tipo Contenedor',
-                title="Comparación de Precios Promedio por Proveedor",
-                barmode='group'
-            )
-            
-            st.plotly_chart(fig_avg, use_container_width=True)
+        if not chart_model['avg_prices'].empty:
+            st.plotly_chart(avg_prices_figure(chart_model, data_info['version']), width='stretch')
         
         # Análisis de competitividad
         st.subheader("Análisis de Competitividad")
         
         col1, col2 = st.columns(2)
         
-        with col1:
-            st.write("**Rendimiento por Proveedor (Contenedor 20')**")
-            performance_20 = comparison_df['best_provider_20'].value_counts()
-            performance_20_df = pd.DataFrame({
-                'Proveedor': performance_20.index,
-                'Mejores Precios': performance_20.values,
-                'Porcentaje': (performance_20.values / performance_20.sum() * 100).round(1)
-            })
-            st.dataframe(performance_20_df, use_container_width=True)
-        
-        with col2:
-            st.write("**Rendimiento por Proveedor (Contenedor 40')**")
-            performance_40 = comparison_df['best_provider_40'].value_counts()
-            performance_40_df = pd.DataFrame({
-                'Proveedor': performance_40.index,
-                'Mejores Precios': performance_40.values,
-                'Porcentaje': (performance_40.values / performance_40.sum() * 100).round(1)
-            })
-            st.dataframe(performance_40_df, use_container_width=True)
-
-with tab4:
+        for col, size in zip([col1, col2], CONTAINER_SIZES):
+            with col:
+                st.write(f"**Rendimiento por Proveedor (Contenedor {size}')**")
+                st.dataframe(chart_model['sizes'][size]['performance'], width='stretch')
+
+def render_sin_coincidencias():
     st.header("Destinos sin Coincidencias")
     
     if not no_matches_df.empty:
         st.write(f"Total de destinos disponibles en una sola fuente: **{len(no_matches_df)}**")
         
+        options = consultas.no_match_options(data)
+
         # Port code filter for no matches
         if 'port_code' in no_matches_df.columns:
-            available_ports_no_match = sorted([code for code in no_matches_df['port_code'].unique() if pd.notna(code) and code != ""])
-            
             col1, col2 = st.columns(2)
             
             with col1:
                 port_filter_no_match = st.selectbox(
                     "Filtrar por código de puerto:",
-                    options=["Todos"] + available_ports_no_match,
+                    options=["Todos"] + options['ports'],
                     key="port_filter_no_match"
                 )
             
             with col2:
-                fuentes_disponibles = no_matches_df['source'].unique().tolist()
                 fuente_selected = st.selectbox(
                     "Filtrar por fuente:",
-                    options=["Todas"] + fuentes_disponibles
+                    options=["Todas"] + options['sources']
                 )
-            
-            # Apply filters
-            filtered_no_matches = no_matches_df.copy()
-            if port_filter_no_match != "Todos":
-                filtered_no_matches = filtered_no_matches[filtered_no_matches['port_code'] == port_filter_no_match]
-            if fuente_selected != "Todas":
-                filtered_no_matches = filtered_no_matches[filtered_no_matches['source'] == fuente_selected]
         else:
             # Original filter without port codes
-            fuentes_disponibles = no_matches_df['source'].unique().tolist()
+            port_filter_no_match = "Todos"
             fuente_selected = st.selectbox(
                 "Filtrar por fuente:",
-                options=["Todas"] + fuentes_disponibles
+                options=["Todas"] + options['sources']
             )
-            
-            if fuente_selected != "Todas":
-                filtered_no_matches = no_matches_df[no_matches_df['source'] == fuente_selected]
-            else:
-                filtered_no_matches = no_matches_df
-        
-        # Distribución por fuente
-        source_dist = filtered_no_matches['source'].value_counts()
+
+        # Apply filters
+        no_match_view = consultas.no_match_view(
+            data,
+            None if port_filter_no_match == "Todos" else port_filter_no_match,
+            None if fuente_selected == "Todas" else fuente_selected,
+        )
         
         col1, col2 = st.columns([1, 2])
         
         with col1:
             st.subheader("Distribución por Fuente")
-            source_dist_df = pd.DataFrame({
-                'Fuente': source_dist.index,
-                'Cantidad': source_dist.values,
-                'Porcentaje': (source_dist.values / source_dist.sum() * 100).round(1)
-            })
-            st.dataframe(source_dist_df, use_container_width=True)
+            st.dataframe(no_match_view['source_table'], width='stretch')
         
         with col2:
-            fig_source = px.pie(
-                values=source_dist.values,
-                names=source_dist.index,
-                title="Destinos Únicos por Fuente"
-            )
-            st.plotly_chart(fig_source, use_container_width=True)
+            fig_source = source_pie_figure(no_match_view['source_dist'], data_info['version'], port_filter_no_match, fuente_selected)
+            st.plotly_chart(fig_source, width='stretch')
         
         # Tabla detallada de destinos sin coincidencias
         st.subheader("Detalle de Destinos sin Coincidencias")
         
         # Mostrar tabla
-        if 'port_code' in filtered_no_matches.columns:
-            display_df = filtered_no_matches[['destino', 'port_code', 'source', 'veinte', 'cuarenta']].copy()
-            display_df.columns = ['Destino', 'Puerto', 'Fuente', 'Precio 20\'', 'Precio 40\'']
-        else:
-            display_df = filtered_no_matches[['destino', 'source', 'veinte', 'cuarenta']].copy()
-            display_df.columns = ['Destino', 'Fuente', 'Precio 20\'', 'Precio 40\'']
-        
-        display_df = display_df.fillna('N/A')
-        
-        st.dataframe(display_df, use_container_width=True)
+        st.dataframe(no_match_view['detail'], width='stretch')
     
     else:
         st.info("No hay destinos sin coincidencias en los datos.")
 
-with tab5:
+def render_datos():
     st.header("Datos Detallados")
     
     # Selector de dataset
+    datasets = {"Comparación de Precios": 'comparison', "Destinos sin Coincidencias": 'no_matches'}
+    datasets.update({f"Datos {p['name']}": p['key'] for p in providers})
+    datasets["Estadísticas Resumen"] = 'summary'
     dataset_option = st.selectbox(
         "Seleccionar dataset:",
-        options=[
-            "Comparación de Precios",
-            "Datos AiresDS",
-            "Datos EXIM", 
-            "Datos Silver",
-            "Estadísticas Resumen"
-        ]
+        options=list(datasets)
     )
-    
-    if dataset_option == "Comparación de Precios":
-        st.subheader("Datos de Comparación de Precios")
-        st.dataframe(comparison_df, use_container_width=True)
-        
-        # Opción de descarga
-        csv = comparison_df.to_csv(index=False)
-        st.download_button(
-            label="Descargar datos como CSV",
-            data=csv,
-            file_name="comparacion_precios.csv",
-            mime="text/csv"
-        )
-    
-    elif dataset_option == "Datos AiresDS":
-        st.subheader("Datos de AiresDS")
-        st.dataframe(airesds_df, use_container_width=True)
-    
-    elif dataset_option == "Datos EXIM":
-        st.subheader("Datos de EXIM")
-        st.dataframe(exim_df, use_container_width=True)
-    
-    elif dataset_option == "Datos Silver":
-        st.subheader("Datos de Silver")
-        st.dataframe(silver_df, use_container_width=True)
-    
-    elif dataset_option == "Estadísticas Resumen":
-        st.subheader("Estadísticas de Resumen")
-        summary_display = summary_stats.copy()
-        summary_display.index = [
-            "Total destinos comparados",
-            "Diferencia promedio 20' (%)",
-            "Diferencia máxima 20' (%)", 
-            "Diferencia promedio 40' (%)",
-            "Diferencia máxima 40' (%)",
-            "AiresDS mejores precios 20'",
-            "EXIM mejores precios 20'",
-            "Silver mejores precios 20'",
-            "AiresDS mejores precios 40'",
-            "EXIM mejores precios 40'",
-            "Silver mejores precios 40'"
-        ]
-        st.dataframe(summary_display, use_container_width=True)
-        st.dataframe(fcl_df, use_container_width=True)
-    
-    elif dataset_option == "Datos Silver":
-        st.subheader("Datos de Silver")
-        st.dataframe(silver_df, use_container_width=True)
-    
-    elif dataset_option == "Estadísticas Resumen":
+    dataset = datasets[dataset_option]
+
+    # Filtros de la vista (también se aplican a la descarga)
+    export_port, export_source = None, None
+    if dataset in ('comparison', 'no_matches'):
+        col1, col2 = st.columns(2)
+        with col1:
+            ports = port_index['ports'] if dataset == 'comparison' else consultas.no_match_options(data)['ports']
+            port_option = st.selectbox("Filtrar por código de puerto:", options=["Todos"] + ports, key=f"export_port_{dataset}")
+            export_port = None if port_option == "Todos" else port_option
+        if dataset == 'no_matches':
+            with col2:
+                source_option = st.selectbox("Filtrar por fuente:", options=["Todas"] + consultas.no_match_options(data)['sources'],
+                                             key="export_source")
+                export_source = None if source_option == "Todas" else source_option
+    view = consultas.dataset_view(data, dataset, export_port, export_source)
+
+    if dataset == 'summary':
         st.subheader("Estadísticas de Resumen")
-        summary_display = summary_stats.copy()
-        summary_display.index = [
-            "Total destinos comparados",
-            "Diferencia promedio 20' (%)",
-            "Diferencia máxima 20' (%)", 
-            "Diferencia promedio 40' (%)",
-            "Diferencia máxima 40' (%)",
-            "AiresDS mejores precios 20'",
-            "EXIM mejores precios 20'",
-            "Silver mejores precios 20'",
-            "AiresDS mejores precios 40'",
-            "EXIM mejores precios 40'",
-            "Silver mejores precios 40'"
-        ]
-        st.dataframe(summary_display, use_container_width=True)
+        summary_labels = {
+            'total_destinations_compared': "Total destinos comparados",
+            'avg_price_diff_20_pct': "Diferencia promedio 20' (%)",
+            'max_price_diff_20_pct': "Diferencia máxima 20' (%)",
+            'avg_price_diff_40_pct': "Diferencia promedio 40' (%)",
+            'max_price_diff_40_pct': "Diferencia máxima 40' (%)",
+        }
+        for size in CONTAINER_SIZES:
+            for p in providers:
+                summary_labels[f"{p['key']}_best_count_{size}"] = f"{p['name']} mejores precios {size}'"
+        summary_display = view.copy()
+        summary_display.index = [summary_labels.get(key, key) for key in summary_display.index]
+        st.dataframe(summary_display, width='stretch')
+    else:
+        titles = {'comparison': "Datos de Comparación de Precios", 'no_matches': "Destinos sin Coincidencias"}
+        st.subheader(titles.get(dataset, f"Datos de {dataset_option[len('Datos '):]}"))
+        st.dataframe(view, width='stretch')
+
+    # Opción de descarga: el archivo se genera al hacer clic y se reutiliza mientras no cambien los datos
+    formato = st.radio("Formato de descarga:", options=["CSV", "Excel", "Parquet"], horizontal=True)
+    fmt = {"CSV": 'csv', "Excel": 'xlsx', "Parquet": 'parquet'}[formato]
+    file_names = {'comparison': "comparacion_precios", 'no_matches': "destinos_sin_coincidencias", 'summary': "estadisticas_resumen"}
+    file_name = "_".join([file_names.get(dataset, f"datos_{dataset}")] + [part for part in [export_port, export_source] if part])
+    st.download_button(
+        label=f"Descargar datos como {formato}",
+        data=lambda: consultas.export(data, dataset, fmt, export_port, export_source),
+        file_name=f"{file_name}.{fmt}",
+        mime=consultas.EXPORT_FORMATS[fmt]
+    )
+
+def render_tendencias():
+    st.header("Evolución de Precios")
+
+    # Agregados mensuales calculados por comparacion.py a partir del historial (data/price_trends.csv)
+    trends = consultas.load_trends()
+    if trends is None:
+        st.info("Todavía no hay historial de precios. Ejecutá comparacion.py (o historial.py import) para generarlo.")
+        return
+
+    trend_index = consultas.trend_index(trends)
+    col1, col2 = st.columns([2, 1])
+    with col1:
+        puerto = st.selectbox("Puerto:", options=trend_index['ports'], key="trend_port")
+    with col2:
+        size = st.radio("Contenedor:", options=CONTAINER_SIZES, format_func=lambda s: f"{s}'", horizontal=True,
+                        key="trend_size")
+
+    trend_view = consultas.trend_view(trends, puerto, size)
+    if trend_view.empty:
+        st.info(f"No hay precios de {size}' registrados para {puerto}.")
+        return
+
+    st.plotly_chart(trend_figure(trend_view, trends['version'], puerto, size), width='stretch')
+
+    tabla = trend_view.copy()
+    tabla['Mes'] = tabla['Mes'].dt.strftime('%m/%Y')
+    for column in ['Mínimo', 'Promedio', 'Máximo']:
+        tabla[column] = money_fmt_series(tabla[column])
+    st.dataframe(tabla, width='stretch', hide_index=True)
+
+# Vistas del dashboard
+VIEWS = {
+    "Comparación de Precios": render_comparacion,
+    "Resumen": render_resumen,
+    "Análisis por Proveedor": render_proveedores,
+    "Destinos sin Coincidencias": render_sin_coincidencias,
+    "Evolución de Precios": render_tendencias,
+    "Datos Detallados": render_datos,
+}
 
+# Con la vista activa solo se ejecuta la pestaña elegida; con pestañas (st.tabs) se ejecutan todas en cada rerun
+lazy_views = st.sidebar.toggle("Ejecutar solo la vista activa", value=True)
+if lazy_views:
+    vista = st.radio("Vista:", options=list(VIEWS), horizontal=True, key="vista", label_visibility="collapsed")
+    with timed(vista):
+        VIEWS[vista]()
+else:
+    for tab, (name, render) in zip(st.tabs(list(VIEWS)), VIEWS.items()):
+        with tab, timed(name):
+            render()
 
+# Tiempos del rerun por vista, y el último total de cada modo para compararlos
+rerun_ms = st.session_state.setdefault('rerun_ms', {})
+rerun_ms["Vista activa" if lazy_views else "Pestañas"] = sum(render_times.values()) * 1000
+with st.sidebar.expander("Rendimiento", expanded=False):
+    for name, seconds in render_times.items():
+        st.write(f"{name}: {seconds * 1000:.0f} ms")
+    st.write(f"Total: {sum(render_times.values()) * 1000:.0f} ms")
+    for mode, ms in rerun_ms.items():
+        st.caption(f"Último rerun · {mode}: {ms:.0f} ms")
@@ -1,6 +1,17 @@
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import os
 import re
+import json
+import math
+import time
+import hashlib
+import inspect
+import sqlite3
+from collections import Counter, defaultdict
+from itertools import islice
+from concurrent.futures import ProcessPoolExecutor
 from difflib import SequenceMatcher
 
 def extract_port_code(destination):
@@ -87,294 +98,1601 @@ def find_best_match(destination, destination_list, threshold=0.8):
     
     return best_match
 
-# Read and clean data
-airesds = pd.read_excel('airesds.xlsx')
-fcl = pd.read_excel('fcl.xlsx')
-silver = pd.read_excel('silver.xlsx')
-
-# Clean AiresDS data
-airesds = airesds.dropna(subset=['veinte', 'curenta'])
-airesds = airesds[~airesds['destino'].str.startswith('*')]
-airesds = airesds[~airesds['destino'].str.contains('HAPAG:', na=False)]
-airesds['veinte'] = airesds['veinte'].replace({'\$': '', ',': ''}, regex=True).astype(float)
-airesds['curenta'] = airesds['curenta'].replace({'\$': '', ',': ''}, regex=True).astype(float)
-airesds = airesds.reset_index(drop=True)
-
-# Rename columns for consistency
-airesds.rename(columns={'curenta': 'cuarenta'}, inplace=True)
-
-fcl['veinte'] = fcl['veinte'].fillna(0).astype(float)
-fcl['cuarenta'] = fcl['cuarenta'].fillna(0).astype(float)
-silver['veinte'] = silver['veinte'].replace({'-': '0'}, regex=True).astype(float)
-silver['veinte'] = silver['veinte'].fillna(0).astype(float)
-silver['cuarenta'] = silver['cuarenta'].fillna(0).astype(float)
-
-# Add port code extraction to all datasets
-airesds['port_code'] = airesds['destino'].apply(extract_port_code)
-fcl['port_code'] = fcl['destino'].apply(extract_port_code)
-silver['port_code'] = silver['destino'].apply(extract_port_code)
-
-# Add source columns
-airesds['source'] = 'AiresDS'
-fcl['source'] = 'EXIM'
-silver['source'] = 'Silver'
-
-# Create a comprehensive comparison with improved matching
-all_destinations = set(airesds['destino'].tolist() + fcl['destino'].tolist() + silver['destino'].tolist())
-
-# Create mapping dictionaries for fuzzy matching
-airesds_destinations = airesds['destino'].tolist()
-fcl_destinations = fcl['destino'].tolist()
-silver_destinations = silver['destino'].tolist()
-
-comparison_data = []
-no_matches_data = []
-matched_destinations = set()
-
-print("Starting destination matching process...")
-print(f"Total unique destinations found: {len(all_destinations)}")
-
-for destino in all_destinations:
-    if destino in matched_destinations:
-        continue  # Skip if already processed as part of a match
-    
-    # Extract port code for current destination
-    current_port_code = extract_port_code(destino)
-    
-    # Try exact match first
-    aires_data = airesds[airesds['destino'] == destino]
-    fcl_data = fcl[fcl['destino'] == destino]
-    silver_data = silver[silver['destino'] == destino]
-    
-    # If no exact matches, try fuzzy matching (city name only, not port code)
-    aires_match = destino if len(aires_data) > 0 else find_best_match(destino, airesds_destinations)
-    fcl_match = destino if len(fcl_data) > 0 else find_best_match(destino, fcl_destinations)
-    silver_match = destino if len(silver_data) > 0 else find_best_match(destino, silver_destinations)
-    
-    # Get data based on matches (exact or fuzzy)
-    if aires_match:
-        aires_data = airesds[airesds['destino'] == aires_match]
-        matched_destinations.add(aires_match)
-    if fcl_match:
-        fcl_data = fcl[fcl['destino'] == fcl_match]
-        matched_destinations.add(fcl_match)
-    if silver_match:
-        silver_data = silver[silver['destino'] == silver_match]
-        matched_destinations.add(silver_match)
-    
-    # Add current destination to matched set
-    matched_destinations.add(destino)
-    
-    # Check if destination exists in each dataset
-    has_aires = len(aires_data) > 0
-    has_fcl = len(fcl_data) > 0
-    has_silver = len(silver_data) > 0
-    
-    # Count available sources
-    sources_count = sum([has_aires, has_fcl, has_silver])
-    
-    if sources_count >= 2:  # At least 2 sources for comparison
-        # Determine the primary destination name (prefer exact matches)
-        primary_destino = destino
-        if aires_match and aires_match != destino:
-            primary_destino = f"{destino} / {aires_match}"
-        elif fcl_match and fcl_match != destino:
-            primary_destino = f"{destino} / {fcl_match}"
-        elif silver_match and silver_match != destino:
-            primary_destino = f"{destino} / {silver_match}"
-        
-        row = {'destino': primary_destino}
-        
-        # Add port code information for visualization
-        row['port_code'] = current_port_code
-        if not current_port_code and aires_match:
-            row['port_code'] = extract_port_code(aires_match)
-        if not row['port_code'] and fcl_match:
-            row['port_code'] = extract_port_code(fcl_match)
-        if not row['port_code'] and silver_match:
-            row['port_code'] = extract_port_code(silver_match)
-        
-        # Store original destination names for reference
-        row['aires_original'] = aires_match if has_aires else None
-        row['fcl_original'] = fcl_match if has_fcl else None
-        row['silver_original'] = silver_match if has_silver else None
-        
-        # AiresDS prices
-        if has_aires:
-            row['aires_20'] = aires_data.iloc[0]['veinte']
-            row['aires_40'] = aires_data.iloc[0]['cuarenta']
+# Same patterns as extract_port_code, tried in the same order
+PORT_CODE_PATTERNS = [
+    r'\(([A-Z]{4,5})\)',
+    r'\s-\s([A-Z]{4,5})$',
+    r'\s([A-Z]{4,5})$',
+    r'\b([A-Z]{4,5})\b',
+]
+
+# Python-backed strings so \s and \b follow the same Unicode rules as re in the scalar
+# functions; the pyarrow backend's regex engine only treats ASCII whitespace as \s
+PYTHON_STRING = pd.StringDtype('python')
+
+def _per_unique(destinations, transform):
+    """Apply a vectorized string transform to the distinct destinations only."""
+    codes, uniques = pd.factorize(destinations)
+    values = transform(pd.Series(uniques, dtype=PYTHON_STRING).str.strip()).fillna('').to_numpy(dtype=object)
+    result = np.full(len(destinations), '', dtype=object)
+    found = codes >= 0
+    result[found] = values[codes[found]]
+    return pd.Series(result, index=destinations.index)
+
+def _port_codes_transform(text):
+    codes = pd.Series(pd.NA, index=text.index, dtype=PYTHON_STRING)
+    for pattern in PORT_CODE_PATTERNS:
+        # Later patterns only run on the rows the earlier ones left without a code
+        missing = codes.isna() & text.notna()
+        if not missing.any():
+            break
+        codes[missing] = text[missing].str.extract(pattern, expand=False)
+    return codes
+
+def _city_names_transform(text):
+    # Keep only what comes before the first '(', '-' or '/', in that order
+    for separator in [r'\(', '-', '/']:
+        text = text.str.replace(f'(?s){separator}.*', '', regex=True).str.strip()
+    return text.str.replace(r'\s+', ' ', regex=True).str.lower().str.strip()
+
+def extract_port_codes(destinations):
+    """Vectorized extract_port_code over a Series of destinations."""
+    return _per_unique(destinations, _port_codes_transform)
+
+def extract_city_names(destinations):
+    """Vectorized extract_city_name over a Series of destinations."""
+    return _per_unique(destinations, _city_names_transform)
+
+def normalize_destinations(df, vectorized=True):
+    """
+    Add 'port_code' and 'city_name' columns computed once per tariff row.
+    Matching and row assembly read these columns instead of parsing destinations again.
+    """
+    if vectorized:
+        df['port_code'] = extract_port_codes(df['destino'])
+        df['city_name'] = extract_city_names(df['destino'])
+    else:
+        df['port_code'] = df['destino'].apply(extract_port_code)
+        df['city_name'] = df['destino'].apply(extract_city_name)
+    return df
+
+def unique_cities(destination_list, city_names=None):
+    """
+    (city name, destination) for the first destination of each non-empty city name,
+    the only candidates that can win in find_best_match.
+    """
+    if city_names is None:
+        city_names = [extract_city_name(dest) for dest in destination_list]
+    seen = set()
+    candidates = []
+    for dest, dest_city in zip(destination_list, city_names):
+        if dest_city and dest_city not in seen:
+            seen.add(dest_city)
+            candidates.append((dest_city, dest))
+    return candidates
+
+def _bigram_tokens(text):
+    """Turn a string into its multiset of character bigrams as (bigram, occurrence) tokens."""
+    seen = Counter()
+    tokens = []
+    for start in range(len(text) - 1):
+        bigram = text[start:start + 2]
+        seen[bigram] += 1
+        tokens.append((bigram, seen[bigram]))
+    return tokens
+
+def _min_shared_bigrams(total_length, threshold):
+    """
+    Smallest number of bigrams two strings of this combined length share when their
+    SequenceMatcher.ratio() reaches the threshold. The ratio is 2*M/total with M
+    characters in matching blocks; blocks are never adjacent, so K blocks leave at
+    least K-1 characters unmatched, and together they contain M-K >= 3*M-total-1
+    bigrams of both strings. Zero or less means bigrams cannot rule the pair out.
+    """
+    matched = math.ceil(threshold * total_length / 2 - 1e-9)
+    return 3 * matched - total_length - 1
+
+def _char_tokens(text):
+    """Turn a string into its multiset of characters as (char, occurrence) tokens."""
+    seen = Counter()
+    tokens = []
+    for ch in text:
+        seen[ch] += 1
+        tokens.append((ch, seen[ch]))
+    return tokens
+
+class DestinationMatcher:
+    """
+    Indexed version of find_best_match for one provider's destination list.
+
+    City names are extracted once and indexed in two inverted indexes, one on
+    their (character, occurrence) tokens and one on their (bigram, occurrence)
+    tokens, with every posting list kept as a numpy array. A query merges the
+    posting lists of its own tokens with np.bincount, which gives the exact
+    number of characters and bigrams it shares with every name at once (T-occurrence
+    counting). Only the names inside the length window that reach both overlap
+    bounds are scored, so results are identical to find_best_match while the
+    names scored per query hardly grow with the list; scanned counts them.
+    """
+
+    def __init__(self, destination_list, threshold=0.8, city_names=None, cache=None, provider=None):
+        self.threshold = threshold
+        self.scanned = 0
+        self._cities = []
+        self._originals = []
+        self._results = {}
+        self._from_cache = set()
+        self._cache = cache
+        self._provider = provider
+
+        # Keep the first destination for each city, as find_best_match does on ties
+        for dest_city, dest in unique_cities(destination_list, city_names):
+            self._cities.append(dest_city)
+            self._originals.append(dest)
+
+        self._lengths = np.array([len(city) for city in self._cities], dtype=np.int64)
+        self._char_index = self._build_index(_char_tokens)
+        self._bigram_index = self._build_index(_bigram_tokens)
+
+        # Results persisted by earlier runs over the same destination list
+        if cache is not None:
+            if cache.threshold != threshold:
+                raise ValueError(f"Match cache holds results for threshold {cache.threshold}, not {threshold}")
+            cache.use_candidates(provider, zip(self._cities, self._originals))
+            self._results.update((city, match) for city, (match, _) in cache.entries(provider).items())
+            self._from_cache = set(self._results)
+
+    def _build_index(self, tokenize):
+        """Posting list (array of name indices) of every token of the indexed names."""
+        postings = defaultdict(list)
+        for i, city in enumerate(self._cities):
+            for token in tokenize(city):
+                postings[token].append(i)
+        return {token: np.array(names, dtype=np.int64) for token, names in postings.items()}
+
+    def _shared(self, index, tokens):
+        """Number of tokens every indexed name shares with a query."""
+        lists = [index[token] for token in tokens if token in index]
+        if not lists:
+            return np.zeros(len(self._cities), dtype=np.int64)
+        return np.bincount(np.concatenate(lists), minlength=len(self._cities))
+
+    def candidates(self, city_name):
+        """Indices of the indexed city names that can reach the threshold."""
+        if not self._cities:
+            return []
+        length = len(city_name)
+        total_lengths = length + self._lengths
+        # 2*M/(la+lb) with M <= min(la, lb): names much shorter or longer cannot reach the threshold
+        if self.threshold > 0:
+            low = self.threshold * length / (2 - self.threshold) - 1e-9
+            high = length * (2 - self.threshold) / self.threshold + 1e-9
+            possible = (self._lengths >= low) & (self._lengths <= high)
         else:
-            row['aires_20'] = np.nan
-            row['aires_40'] = np.nan
-        
-        # FCL prices
-        if has_fcl:
-            row['fcl_20'] = fcl_data.iloc[0]['veinte']
-            row['fcl_40'] = fcl_data.iloc[0]['cuarenta']
+            possible = np.ones(len(self._cities), dtype=bool)
+        # Shared characters and bigrams bound the ratio from above, drop pairs that cannot pass
+        matched = np.ceil(self.threshold * total_lengths / 2 - 1e-9)
+        possible &= self._shared(self._bigram_index, _bigram_tokens(city_name)) >= 3 * matched - total_lengths - 1
+        possible &= 2 * self._shared(self._char_index, _char_tokens(city_name)) >= self.threshold * total_lengths - 1e-9
+        found = np.flatnonzero(possible).tolist()
+        self.scanned += len(found)
+        return found
+
+    def match(self, destination):
+        """Same contract as find_best_match(destination, destination_list, threshold)."""
+        return self.match_city(extract_city_name(destination))
+
+    def match_city(self, city_name):
+        """Best match for an already normalized city name."""
+        if not city_name:
+            return None
+        if city_name in self._results:
+            # A hit is a name resolved from the cache instead of scored, counted once
+            if city_name in self._from_cache:
+                self._from_cache.discard(city_name)
+                self._cache.hits += 1
+            return self._results[city_name]
+
+        if self._cache is not None:
+            self._cache.misses += 1
+
+        best_match = None
+        best_score = 0
+        for i in self.candidates(city_name):
+            score = similarity_score(city_name, self._cities[i])
+            if score > best_score and score >= self.threshold:
+                best_score = score
+                best_match = self._originals[i]
+
+        self._results[city_name] = best_match
+        if self._cache is not None:
+            self._cache.put(self._provider, city_name, best_match, best_score)
+        return best_match
+
+# Bump when the matching algorithm changes in a way that alters its results
+MATCH_ALGORITHM_VERSION = 1
+
+def match_cache_version(threshold):
+    """
+    Version stamp of the match cache: algorithm version, threshold and a digest of the
+    normalization and scoring code, so editing any of them invalidates the cache.
+    """
+    code = ''.join(inspect.getsource(func) for func in [extract_city_name, _city_names_transform, similarity_score])
+    digest = hashlib.sha1(code.encode('utf-8')).hexdigest()[:12]
+    return f"{MATCH_ALGORITHM_VERSION}:{threshold}:{digest}"
+
+class MatchCache:
+    """
+    On-disk cache of fuzzy match results in SQLite.
+
+    Entries map (provider, normalized city name) to the matched destination (None when
+    nothing reached the threshold) and its score. The whole cache is cleared when the
+    version stamp changes, and a provider's entries are cleared when its list of
+    candidate destinations changes, since the best match depends on it. A cache only
+    serves matchers with the threshold it was opened with.
+    """
+
+    def __init__(self, path='data/match_cache.sqlite', threshold=0.8):
+        self.path = path
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        self._entries = {}
+        self._pending = []
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS matches (
+            provider TEXT NOT NULL, source TEXT NOT NULL, match TEXT, score REAL,
+            PRIMARY KEY (provider, source))""")
+
+        version = match_cache_version(threshold)
+        if self._meta('version') != version:
+            self._conn.execute("DELETE FROM matches")
+            self._conn.execute("DELETE FROM meta")
+            self._set_meta('version', version)
+        self._conn.commit()
+
+    def _meta(self, key):
+        row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    def use_candidates(self, provider, candidates):
+        """Declare the (city name, destination) candidates; drops the provider's entries if they changed."""
+        digest = hashlib.sha1()
+        for city, dest in candidates:
+            digest.update(f"{city}\t{dest}\n".encode('utf-8'))
+        fingerprint = digest.hexdigest()
+        if self._meta(f'candidates:{provider}') != fingerprint:
+            self._conn.execute("DELETE FROM matches WHERE provider = ?", (provider,))
+            self._set_meta(f'candidates:{provider}', fingerprint)
+            self._conn.commit()
+            self._entries.pop(provider, None)
+
+    def entries(self, provider):
+        """All cached source -> (match, score) entries of a provider."""
+        if provider not in self._entries:
+            rows = self._conn.execute("SELECT source, match, score FROM matches WHERE provider = ?", (provider,))
+            self._entries[provider] = {source: (match, score) for source, match, score in rows}
+        return self._entries[provider]
+
+    def put(self, provider, source, match, score):
+        self.entries(provider)[source] = (match, score)
+        self._pending.append((provider, source, match, score))
+
+    def save(self):
+        """Write the entries added since the last save."""
+        self._conn.executemany("INSERT OR REPLACE INTO matches VALUES (?, ?, ?, ?)", self._pending)
+        self._conn.commit()
+        self._pending = []
+
+    def close(self):
+        self.save()
+        self._conn.close()
+
+# Provider registry, in tie-breaking order. 'key' prefixes the comparison columns
+# (aires_20, aires_original, ...), 'name' is the label used in reports and 'columns'
+# renames the workbook columns to destino/veinte/cuarenta. The remaining keys are
+# cleaning rules applied by clean_provider. Disabled providers only run when
+# requested with --providers.
+PROVIDERS = [
+    {
+        'key': 'aires',
+        'name': 'AiresDS',
+        'file': 'airesds.xlsx',
+        'data_csv': 'data/airesds_data.csv',
+        'columns': {'curenta': 'cuarenta'},
+        'dropna_prices': True,
+        'drop_prefixes': ['*'],
+        'drop_contains': ['HAPAG:'],
+        'strip_currency': True,
+    },
+    {
+        'key': 'fcl',
+        'name': 'EXIM',
+        'file': 'fcl.xlsx',
+        'data_csv': 'data/exim_data.csv',
+        'fillna_zero': True,
+    },
+    {
+        'key': 'silver',
+        'name': 'Silver',
+        'file': 'silver.xlsx',
+        'data_csv': 'data/silver_data.csv',
+        'dash_as_zero': True,
+        'fillna_zero': True,
+    },
+    {
+        'key': 'silverfreight',
+        'name': 'Silverfreight',
+        'file': 'Fletes Silverfreight.xlsx',
+        'sheet': 'Precios Fletes',
+        'data_csv': 'data/silverfreight_data.csv',
+        'columns': {'Port': 'destino', '20’': 'veinte', '40’': 'cuarenta'},
+        'invalid_as_nan': True,
+        'dropna_prices': True,
+        'enabled': False,
+    },
+    {
+        'key': 'aires_fcl',
+        'name': 'Aires - FCL',
+        'file': 'Fletes - Aires - FCL.xlsx',
+        'sheet': 'Precio fletes',
+        'data_csv': 'data/aires_fcl_data.csv',
+        'columns': {'POE': 'destino', 'Precio 1x20': 'veinte', 'Precio 1x40 ': 'cuarenta'},
+        'dropna_prices': True,
+        'drop_prefixes': ['*'],
+        'drop_contains': ['HAPAG:'],
+        'enabled': False,
+    },
+]
+
+# Fuzzy matching threshold used by every provider matcher
+MATCH_THRESHOLD = 0.8
+
+# Cleaned provider frames cached as Parquet, see ingest_provider
+INGEST_CACHE_DIR = 'data/cache'
+
+# Persistent fuzzy match results, see MatchCache
+MATCH_CACHE_FILE = 'data/match_cache.sqlite'
+
+# Previous run state for incremental re-runs; bump the version when its layout changes
+STATE_FILE = 'data/comparison_state.pkl'
+STATE_VERSION = 1
+
+# Append-only tariff history written by every run, see PriceHistory
+HISTORY_FILE = 'data/history.sqlite'
+
+# Monthly price rollups exported from the history for the dashboard trends tab
+TRENDS_CSV = 'data/price_trends.csv'
+
+# Typed Arrow IPC copies of the CSV outputs, read by the dashboard (see write_artifact)
+ARTIFACT_DIR = 'data/arrow'
+ARTIFACT_CATEGORIES = ['port_code', 'source', 'match_type', 'reason', 'provider', 'port', 'month', 'size']
+
+# Workbook rows read, cleaned and matched at a time in streaming mode (see run_streaming)
+STREAM_CHUNK_ROWS = 50_000
+
+# Price column in the provider frames for each container size
+CONTAINER_COLUMNS = {'20': 'veinte', '40': 'cuarenta'}
+CONTAINER_SIZES = list(CONTAINER_COLUMNS)
+
+def get_providers(keys=None):
+    """Registry entries for the given keys, or the enabled providers by default."""
+    if keys is None:
+        return [p for p in PROVIDERS if p.get('enabled', True)]
+    by_key = {p['key']: p for p in PROVIDERS}
+    unknown = [key for key in keys if key not in by_key]
+    if unknown:
+        raise ValueError(f"Unknown providers: {', '.join(unknown)}")
+    return [by_key[key] for key in keys]
+
+def provider_labels(providers):
+    """Column prefix -> report name, in registry order."""
+    return {p['key']: p['name'] for p in providers}
+
+def clean_provider(df, provider, normalize=True):
+    """
+    Apply a provider's cleaning rules to its raw workbook frame.
+    Returns destino/veinte/cuarenta with float prices, plus port_code, city_name and source
+    (without port_code and city_name when normalize is False).
+    """
+    df = df.rename(columns=provider.get('columns', {}))
+    df = df[['destino'] + list(CONTAINER_COLUMNS.values())]
+    price_columns = list(CONTAINER_COLUMNS.values())
+
+    if provider.get('dropna_prices'):
+        df = df.dropna(subset=price_columns)
+    for prefix in provider.get('drop_prefixes', []):
+        df = df[~df['destino'].str.startswith(prefix, na=False)]
+    for text in provider.get('drop_contains', []):
+        df = df[~df['destino'].str.contains(text, na=False, regex=False)]
+    df = df.reset_index(drop=True)
+
+    for column in price_columns:
+        prices = df[column]
+        if provider.get('strip_currency'):
+            prices = prices.replace({r'\$': '', ',': ''}, regex=True)
+        if provider.get('dash_as_zero'):
+            prices = prices.replace({'-': '0'}, regex=True)
+        if provider.get('invalid_as_nan'):
+            prices = pd.to_numeric(prices, errors='coerce')
+        prices = prices.astype(float)
+        if provider.get('fillna_zero'):
+            prices = prices.fillna(0)
+        df[column] = prices
+
+    # Normalize destinations once per row (port code and city name)
+    if normalize:
+        df = normalize_destinations(df)
+    df['source'] = provider['name']
+    return df
+
+def load_provider(provider, timings=None):
+    """
+    Read and clean one provider workbook. With a timings dict, the seconds spent
+    reading, cleaning and normalizing are stored under 'ingest', 'clean' and 'normalize'.
+    """
+    start = time.perf_counter()
+    raw = pd.read_excel(provider['file'], sheet_name=provider.get('sheet', 0))
+    read = time.perf_counter()
+    df = clean_provider(raw, provider, normalize=False)
+    cleaned = time.perf_counter()
+    # Same columns as clean_provider with normalize, source last
+    source = df.pop('source')
+    df = normalize_destinations(df)
+    df['source'] = source
+    if timings is not None:
+        timings.update(ingest=read - start, clean=cleaned - read, normalize=time.perf_counter() - cleaned)
+    return df
+
+def file_digest(path):
+    """SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cleaning_digest(provider):
+    """Digest of a provider's registry entry and the cleaning code; cached frames depend on both."""
+    code = ''.join(inspect.getsource(func) for func in [clean_provider, normalize_destinations, _per_unique,
+                                                        _port_codes_transform, _city_names_transform])
+    entry = json.dumps(provider, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1((entry + code).encode('utf-8')).hexdigest()
+
+def read_ingest_cache(provider, cache_dir=INGEST_CACHE_DIR):
+    """
+    Cached cleaned frame of a provider, or None when the workbook or its rules changed.
+
+    The workbook counts as unchanged when its mtime and size match the cached metadata
+    or, failing that, its SHA-1 does; in that case the metadata is refreshed so the
+    next run skips the hash.
+    """
+    parquet_path = os.path.join(cache_dir, f"{provider['key']}.parquet")
+    meta_path = os.path.join(cache_dir, f"{provider['key']}.json")
+    if not (os.path.exists(meta_path) and os.path.exists(parquet_path)):
+        return None
+    with open(meta_path) as f:
+        meta = json.load(f)
+    if meta.get('rules') != cleaning_digest(provider):
+        return None
+
+    stat = os.stat(provider['file'])
+    if (meta['mtime'], meta['size']) != (stat.st_mtime, stat.st_size):
+        if file_digest(provider['file']) != meta['sha1']:
+            return None
+        # Only the mtime changed
+        _write_ingest_meta(provider, stat, meta['sha1'], cache_dir)
+    return pd.read_parquet(parquet_path)
+
+def _write_ingest_meta(provider, stat, sha1, cache_dir=INGEST_CACHE_DIR):
+    with open(os.path.join(cache_dir, f"{provider['key']}.json"), 'w') as f:
+        json.dump({'file': provider['file'], 'mtime': stat.st_mtime, 'size': stat.st_size,
+                   'sha1': sha1, 'rules': cleaning_digest(provider)}, f)
+
+def write_ingest_cache(provider, df, stat, cache_dir=INGEST_CACHE_DIR):
+    """Store a freshly cleaned frame for a workbook whose os.stat before parsing was stat."""
+    os.makedirs(cache_dir, exist_ok=True)
+    df.to_parquet(os.path.join(cache_dir, f"{provider['key']}.parquet"), index=False)
+    _write_ingest_meta(provider, stat, file_digest(provider['file']), cache_dir)
+
+def ingest_provider(provider, cache_dir=INGEST_CACHE_DIR):
+    """
+    Load one provider's cleaned frame, reusing a cached Parquet copy when the workbook is
+    unchanged (see read_ingest_cache). Otherwise it is parsed and cleaned again and the
+    cache is refreshed. Returns the frame and a report with the source and load time.
+    """
+    start = time.perf_counter()
+    df = read_ingest_cache(provider, cache_dir)
+    source = 'cache'
+    if df is None:
+        stat = os.stat(provider['file'])
+        df = load_provider(provider)
+        write_ingest_cache(provider, df, stat, cache_dir)
+        source = 'workbook'
+    report = {'provider': provider['name'], 'file': provider['file'], 'source': source,
+              'seconds': time.perf_counter() - start}
+    return df, report
+
+def _ingest_uncached(provider):
+    start = time.perf_counter()
+    timings = {}
+    df = load_provider(provider, timings)
+    return df, {'provider': provider['name'], 'file': provider['file'], 'source': 'workbook',
+                'seconds': time.perf_counter() - start, 'stages': timings}
+
+def ingest_providers(providers, workers=None, use_cache=True):
+    """
+    Read and clean every provider workbook, each in its own worker process.
+
+    Cache hits are resolved in this process and only the workbooks that need parsing
+    go to the pool, which is not started at all when every provider is cached.
+    Workbooks are independent, so wall-clock time is bounded by the slowest one.
+    workers=1 (or a single workbook to parse) runs in the current process. Returns the
+    frames by provider key and one load report per provider, with the seconds of its
+    ingest, clean and normalize stages (only ingest for a cache hit).
+    """
+    results = {}
+    if use_cache:
+        for provider in providers:
+            start = time.perf_counter()
+            df = read_ingest_cache(provider)
+            if df is not None:
+                seconds = time.perf_counter() - start
+                results[provider['key']] = df, {'provider': provider['name'], 'file': provider['file'],
+                                                'source': 'cache', 'seconds': seconds,
+                                                'stages': {'ingest': seconds}}
+    pending = [provider for provider in providers if provider['key'] not in results]
+    stats = [os.stat(provider['file']) for provider in pending]
+
+    if workers is None:
+        workers = min(len(pending), os.cpu_count() or 1)
+    if workers <= 1 or len(pending) <= 1:
+        parsed = [_ingest_uncached(provider) for provider in pending]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            parsed = list(pool.map(_ingest_uncached, pending))
+    for provider, stat, (df, report) in zip(pending, stats, parsed):
+        if use_cache:
+            write_ingest_cache(provider, df, stat)
+        results[provider['key']] = df, report
+
+    frames = {provider['key']: results[provider['key']][0] for provider in providers}
+    return frames, [results[provider['key']][1] for provider in providers]
+
+def artifact_path(csv_path, artifact_dir=ARTIFACT_DIR):
+    """Arrow IPC file holding the typed copy of a CSV output."""
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(artifact_dir, f'{name}.arrow')
+
+def to_artifact_types(df):
+    """
+    Compact dtypes for the dashboard: repeated labels as categoricals and prices as float32.
+    Integer and text columns are left as they are.
+    """
+    df = df.copy()
+    for column in df.columns:
+        if column in ARTIFACT_CATEGORIES or column.startswith('best_provider_'):
+            df[column] = df[column].astype('category')
+        elif df[column].dtype == np.float64:
+            df[column] = df[column].astype(np.float32)
+    return df
+
+def write_artifact(df, csv_path, index=False, typed=True, artifact_dir=ARTIFACT_DIR):
+    """
+    Write df next to its CSV as an uncompressed Arrow IPC file, so readers can memory-map it
+    instead of parsing text. index works as in to_csv; typed=False keeps the dtypes as they are.
+    """
+    path = artifact_path(csv_path, artifact_dir)
+    os.makedirs(artifact_dir, exist_ok=True)
+    table = pa.Table.from_pandas(to_artifact_types(df) if typed else df, preserve_index=index)
+    # Write to a temporary file first so a reader never maps a half written file
+    with pa.OSFile(path + '.tmp', 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(path + '.tmp', path)
+    return path
+
+def read_artifact(path):
+    """Memory-map an Arrow IPC artifact and return it as a DataFrame."""
+    return pa.ipc.open_file(pa.memory_map(path)).read_all().to_pandas()
+
+def _excel_rows(df, index=False):
+    """Rows of df as cell values, as to_excel writes them: missing values empty, infinities as text."""
+    values = df.astype(object).replace({np.inf: 'inf', -np.inf: '-inf'})
+    values = values.where(pd.notna(values), None)
+    return values.itertuples(index=index, name=None)
+
+def write_report(path, sheets, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Write an Excel workbook with openpyxl's write-only mode, which streams rows to
+    the file instead of building every cell object first.
+
+    sheets maps each sheet name to (data, index). data is a DataFrame or a callable
+    returning an iterable of DataFrame chunks; callables are only called when their
+    sheet is written, so large sources can be read lazily, one chunk at a time.
+    index works as in to_excel. path can also be a binary file object.
+    """
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    for name, (data, index) in sheets.items():
+        sheet = workbook.create_sheet(name)
+        header = None
+        for chunk in (data() if callable(data) else [data]):
+            if header is None:
+                header = ([chunk.index.name] if index else []) + [str(column) for column in chunk.columns]
+                sheet.append(header)
+            for start in range(0, len(chunk), chunk_rows):
+                for row in _excel_rows(chunk.iloc[start:start + chunk_rows], index):
+                    sheet.append(row)
+    workbook.save(path)
+
+def build_price_table(frames):
+    """
+    Long format price table: one row per provider, destination and container size.
+    frames maps the provider key to its cleaned frame.
+    """
+    parts = []
+    for key, df in frames.items():
+        part = df[['destino', 'port_code'] + list(CONTAINER_COLUMNS.values())].melt(
+            id_vars=['destino', 'port_code'], var_name='container', value_name='price')
+        part['container'] = part['container'].map({column: size for size, column in CONTAINER_COLUMNS.items()})
+        part.insert(0, 'provider', key)
+        parts.append(part)
+    if not parts:
+        return pd.DataFrame(columns=['provider', 'destino', 'port_code', 'container', 'price'])
+    return pd.concat(parts, ignore_index=True)
+
+def build_price_indexes(price_table, sizes=CONTAINER_SIZES):
+    """
+    Per provider, map each destination to its prices (one per container size)
+    taken from its first row, so the comparison loop never scans the frames.
+    """
+    first_rows = price_table.dropna(subset=['destino']).drop_duplicates(['provider', 'destino', 'container'])
+    wide = first_rows.set_index(['provider', 'destino', 'container'])['price'].unstack('container')
+    indexes = {key: {} for key in price_table['provider'].unique()}
+    for key, prices in wide.groupby(level='provider', sort=False):
+        destinos = prices.index.get_level_values('destino')
+        indexes[key] = dict(zip(destinos, zip(*(prices[size] for size in sizes))))
+    return indexes
+
+def add_price_spreads(df, providers, sizes=CONTAINER_SIZES):
+    """
+    Add best/worst price, spread and best provider columns for every container size.
+    providers maps the price column prefix to the provider name, in tie-breaking order.
+
+    Prices are read as a destination x provider array per size; only positive prices
+    count and at least two are needed for a comparison, otherwise the row stays NaN.
+    Ties go to the provider listed first.
+    """
+    labels = np.array(list(providers.values()), dtype=object)
+    spreads = {}
+    for size in sizes:
+        prices = df[[f'{prefix}_{size}' for prefix in providers]].to_numpy(dtype=float)
+        valid = ~np.isnan(prices) & (prices > 0)
+        comparable = valid.sum(axis=1) >= 2
+
+        best = np.where(valid, prices, np.inf).min(axis=1)
+        worst = np.where(valid, prices, -np.inf).max(axis=1)
+        best = np.where(comparable, best, np.nan)
+        worst = np.where(comparable, worst, np.nan)
+        diff = worst - best
+        with np.errstate(invalid='ignore'):
+            diff_pct = (diff / best) * 100
+
+        is_best = valid & (prices == best[:, None])
+        best_provider = np.where(comparable & is_best.any(axis=1), labels[is_best.argmax(axis=1)], np.nan)
+
+        spreads[f'best_price_{size}'] = best
+        spreads[f'worst_price_{size}'] = worst
+        spreads[f'price_diff_{size}'] = diff
+        spreads[f'price_diff_{size}_pct'] = diff_pct
+        spreads[f'best_provider_{size}'] = best_provider
+
+    spreads = pd.DataFrame(spreads, index=df.index)
+    return pd.concat([df.drop(columns=spreads.columns, errors='ignore'), spreads], axis=1)
+
+def comparison_frame(rows, providers):
+    """Comparison rows with their price spreads, keeping the match metadata as the last columns."""
+    trailing = ['sources_available', 'match_type']
+    df = add_price_spreads(pd.DataFrame(rows), providers)
+    return df[[c for c in df.columns if c not in trailing] + trailing]
+
+def summarize_comparison(comparison_df, providers):
+    """Summary statistics of a comparison: spreads per size and best price counts per provider."""
+    summary_stats = {}
+    if not comparison_df.empty:
+        summary_stats['total_destinations_compared'] = len(comparison_df)
+        for size in CONTAINER_SIZES:
+            # Filter out infinite values for statistics
+            valid_diff = comparison_df[f'price_diff_{size}_pct'].replace([np.inf, -np.inf], np.nan).dropna()
+            summary_stats[f'avg_price_diff_{size}_pct'] = valid_diff.mean() if len(valid_diff) > 0 else 0
+            summary_stats[f'max_price_diff_{size}_pct'] = valid_diff.max() if len(valid_diff) > 0 else 0
+        for size in CONTAINER_SIZES:
+            for key, name in providers.items():
+                summary_stats[f'{key}_best_count_{size}'] = (comparison_df[f'best_provider_{size}'] == name).sum()
+    return summary_stats
+
+def summary_frame(summary_stats):
+    """Summary statistics as the one-column frame of the report and CSV."""
+    summary_df = pd.DataFrame([summary_stats]).T
+    summary_df.columns = ['Value']
+    return summary_df
+
+def build_port_code_index(df):
+    """Map each port code to the first destination carrying it (hash join side)."""
+    coded = df[df['port_code'] != ''].drop_duplicates('port_code')
+    return dict(zip(coded['port_code'], coded['destino']))
+
+def resolve_match(destino, city_name, port_code, has_exact, matcher, port_code_index=None):
+    """
+    Match a destination against one provider.
+    Tries the exact destination first, then the port code when a port code index
+    is given (join mode), and only then the fuzzy city matcher.
+    Returns the matched destination (or None) and the stage that resolved it.
+    """
+    if has_exact:
+        return destino, 'exact'
+    if port_code_index is not None and port_code and port_code in port_code_index:
+        return port_code_index[port_code], 'port_code'
+    match = matcher.match_city(city_name)
+    return match, ('fuzzy' if match else 'unmatched')
+
+def build_match_context(frames, join='destino', cache=None):
+    """
+    Everything the comparison loop reads, built once per run: normalized names and
+    codes per destination, one fuzzy matcher, port code index and price index per
+    provider, and the long format price table. Matchers read and fill the
+    optional MatchCache.
+    """
+    context = {'join': join, 'city_names': {}, 'port_codes': {}}
+
+    # Normalized names and codes per destination, read instead of re-parsing
+    for df in frames.values():
+        context['city_names'].update(zip(df['destino'], df['city_name']))
+        context['port_codes'].update(zip(df['destino'], df['port_code']))
+
+    # Build one indexed fuzzy matcher per provider
+    context['matchers'] = {key: DestinationMatcher(df['destino'].tolist(), MATCH_THRESHOLD,
+                                                   city_names=df['city_name'].tolist(),
+                                                   cache=cache, provider=key)
+                           for key, df in frames.items()}
+
+    # In port code join mode, resolve shared UN/LOCODEs before any fuzzy matching
+    context['code_indexes'] = {key: build_port_code_index(df) if join == 'port_code' else None
+                               for key, df in frames.items()}
+
+    # Long format prices, indexed as destino -> prices per provider
+    context['price_table'] = build_price_table(frames)
+    context['price_indexes'] = build_price_indexes(context['price_table'])
+    return context
+
+def match_destinations(destinations, context, labels, matched_destinations=None):
+    """
+    Group destinations across providers and assemble one row per group.
+
+    Destinations already in matched_destinations are skipped, which lets an
+    incremental run keep groups from the previous run. Returns the comparison
+    groups, the groups only available in one source and the lookups resolved per
+    matching stage. Each group is a (destino, members, row) tuple where members is
+    the set of destinations the row was built from.
+    """
+    join = context['join']
+    city_names = context['city_names']
+    port_codes = context['port_codes']
+    matchers = context['matchers']
+    code_indexes = context['code_indexes']
+    price_indexes = context['price_indexes']
+
+    comparison_groups = []
+    no_match_groups = []
+    matched_destinations = set() if matched_destinations is None else matched_destinations
+    stage_counts = Counter()
+
+    for destino in destinations:
+        if destino in matched_destinations:
+            continue  # Skip if already processed as part of a match
+
+        # Port code and city name for current destination
+        current_port_code = port_codes.get(destino, "")
+        current_city_name = city_names.get(destino, "")
+
+        # Try exact match first, then the port code (join mode) and fuzzy city matching
+        matches = {}
+        stages = {}
+        prices = {}
+        for key in labels:
+            matches[key], stages[key] = resolve_match(destino, current_city_name, current_port_code,
+                                                      destino in price_indexes[key], matchers[key],
+                                                      code_indexes[key])
+            # Get prices based on matches (exact or fuzzy)
+            if matches[key]:
+                prices[key] = price_indexes[key].get(matches[key])
+                matched_destinations.add(matches[key])
+        stage_counts.update(stages.values())
+
+        # Add current destination to matched set
+        matched_destinations.add(destino)
+        members = {destino} | {match for match in matches.values() if match}
+
+        # Providers where the destination exists
+        available = [key for key in labels if prices.get(key) is not None]
+        sources_count = len(available)
+
+        if sources_count >= 2:  # At least 2 sources for comparison
+            # Determine the primary destination name (prefer exact matches)
+            primary_destino = destino
+            for key in labels:
+                if matches[key] and matches[key] != destino:
+                    primary_destino = f"{destino} / {matches[key]}"
+                    break
+
+            row = {'destino': primary_destino}
+
+            # Add port code information for visualization
+            row['port_code'] = current_port_code
+            for key in labels:
+                if not row['port_code'] and matches[key]:
+                    row['port_code'] = port_codes.get(matches[key], "")
+
+            # Store original destination names for reference
+            for key in labels:
+                row[f'{key}_original'] = matches[key] if key in available else None
+
+            # Prices per provider (NaN when the provider has no match)
+            for key in labels:
+                provider_prices = prices[key] if key in available else (np.nan,) * len(CONTAINER_SIZES)
+                for size, price in zip(CONTAINER_SIZES, provider_prices):
+                    row[f'{key}_{size}'] = price
+
+            row['sources_available'] = sources_count
+            row['match_type'] = 'exact' if all(match == destino for match in matches.values()) else 'fuzzy'
+            if join == 'port_code' and row['match_type'] == 'fuzzy' and 'fuzzy' not in stages.values():
+                row['match_type'] = 'port_code'
+            comparison_groups.append((destino, members, row))
+
+            # Print matching info for fuzzy matches
+            if row['match_type'] == 'fuzzy':
+                matches_info = [f"{labels[key]}: {matches[key]}" for key in available if matches[key] != destino]
+                if matches_info:
+                    print(f"Fuzzy match found for '{destino}' -> {', '.join(matches_info)}")
+
+        else:  # Destinations with no matches (only in one source)
+            key = available[0] if available else list(labels)[-1]
+            row_prices = prices[key] if available else (np.nan,) * len(CONTAINER_SIZES)
+
+            no_match_row = {
+                'destino': destino,
+                'original_destino': matches[key],
+                'port_code': current_port_code,
+                'source': labels[key],
+            }
+            for size, price in zip(CONTAINER_SIZES, row_prices):
+                no_match_row[CONTAINER_COLUMNS[size]] = price
+            no_match_row['reason'] = 'Only available in one source'
+            no_match_groups.append((destino, members, no_match_row))
+
+    return comparison_groups, no_match_groups, stage_counts
+
+def compute_row_hashes(frames):
+    """Per provider, hash of the destination and prices of each destination's first row."""
+    row_hashes = {}
+    for key, df in frames.items():
+        first_rows = df.dropna(subset=['destino']).drop_duplicates('destino')
+        hashes = pd.util.hash_pandas_object(first_rows[['destino'] + list(CONTAINER_COLUMNS.values())], index=False)
+        row_hashes[key] = dict(zip(first_rows['destino'], hashes.tolist()))
+    return row_hashes
+
+def find_changed_destinations(old_hashes, new_hashes):
+    """Per provider, the destinations that were added, removed or changed price."""
+    changed = {}
+    for key in set(old_hashes) | set(new_hashes):
+        old = old_hashes.get(key, {})
+        new = new_hashes.get(key, {})
+        changed[key] = {
+            'added': new.keys() - old.keys(),
+            'removed': old.keys() - new.keys(),
+            'modified': {destino for destino in new.keys() & old.keys() if new[destino] != old[destino]},
+        }
+    return changed
+
+def carry_over_groups(groups, changed, context):
+    """
+    Keep the previous groups that the tariff changes cannot affect.
+
+    A group is recomputed when any of its destinations was added, removed or
+    changed price, or when a destination added to some provider could now match
+    it (fuzzy city name or, in port code join mode, its port code).
+    """
+    touched = set()
+    added_matchers = {}
+    added_codes = {}
+    for key, diff in changed.items():
+        touched |= diff['added'] | diff['removed'] | diff['modified']
+        if diff['added']:
+            added = sorted(diff['added'])
+            added_matchers[key] = DestinationMatcher(added, MATCH_THRESHOLD,
+                                                     city_names=[context['city_names'][d] for d in added])
+            added_codes[key] = {context['port_codes'][d] for d in added} - {''}
+
+    kept = []
+    for destino, members, row in groups:
+        if members & touched:
+            continue
+        city_name = context['city_names'].get(destino, "")
+        port_code = context['port_codes'].get(destino, "")
+        if any(matcher.match_city(city_name) for matcher in added_matchers.values()):
+            continue
+        if context['join'] == 'port_code' and any(port_code in codes for codes in added_codes.values()):
+            continue
+        kept.append((destino, members, row))
+    return kept
+
+def load_state(path=STATE_FILE):
+    """Previous run state, or None when missing or written by another state version."""
+    if not os.path.exists(path):
+        return None
+    state = pd.read_pickle(path)
+    if state.get('version') != STATE_VERSION:
+        return None
+    return state
+
+def save_state(state, path=STATE_FILE):
+    state['version'] = STATE_VERSION
+    pd.to_pickle(state, path)
+
+def _sql_value(value):
+    """None for missing values, plain Python scalars otherwise."""
+    if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NA:
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+def frame_digest(df):
+    """SHA-1 of a provider frame's destinations and prices, in row order."""
+    hashes = pd.util.hash_pandas_object(df[['destino'] + list(CONTAINER_COLUMNS.values())], index=False)
+    return hashlib.sha1(hashes.values.tobytes()).hexdigest()
+
+class PriceHistory:
+    """
+    Append-only history of provider tariffs and comparisons in SQLite.
+
+    Every run gets a row in runs with its timestamp and tariff date. Its cleaned
+    provider frames go to prices, one row per tariff line, and its comparison to
+    comparisons, one row per destination group with the best/worst prices per size.
+    Price and comparison rows are never updated or deleted. Both tables carry the
+    tariff date and its month, the time partition key, and are indexed by
+    (provider, port_code, date) and (port_code, date) respectively, so the series of
+    one port reads a single index range however many months are stored.
+
+    rollups holds the monthly min/avg/max price per provider, port and container
+    size. It is derived data: refresh_rollups rebuilds the months a run touched.
+    """
+
+    # Comparison columns kept per run; the per-provider price columns are in prices already
+    SPREAD_COLUMNS = [
+        column for size in CONTAINER_SIZES
+        for column in [f'best_price_{size}', f'worst_price_{size}', f'price_diff_{size}',
+                       f'price_diff_{size}_pct', f'best_provider_{size}']
+    ]
+    COMPARISON_COLUMNS = ['destino', 'port_code'] + SPREAD_COLUMNS + ['sources_available', 'match_type']
+
+    def __init__(self, path='data/history.sqlite'):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS runs (
+            run_id INTEGER PRIMARY KEY, run_at TEXT NOT NULL, date TEXT NOT NULL, origin TEXT NOT NULL)""")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS snapshots (
+            run_id INTEGER NOT NULL, provider TEXT NOT NULL, digest TEXT NOT NULL, rows INTEGER NOT NULL,
+            PRIMARY KEY (run_id, provider))""")
+        price_columns = ', '.join(f'{column} REAL' for column in CONTAINER_COLUMNS.values())
+        self._conn.execute(f"""CREATE TABLE IF NOT EXISTS prices (
+            run_id INTEGER NOT NULL, provider TEXT NOT NULL, port_code TEXT, date TEXT NOT NULL,
+            month TEXT NOT NULL, destino TEXT, {price_columns})""")
+        comparison_columns = ', '.join(
+            f"{column} {'TEXT' if column.startswith('best_provider') else 'REAL'}"
+            for column in self.SPREAD_COLUMNS)
+        self._conn.execute(f"""CREATE TABLE IF NOT EXISTS comparisons (
+            run_id INTEGER NOT NULL, port_code TEXT, date TEXT NOT NULL, month TEXT NOT NULL,
+            destino TEXT, {comparison_columns}, sources_available INTEGER, match_type TEXT)""")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS prices_by_port ON prices (provider, port_code, date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS prices_by_month ON prices (month)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS comparisons_by_port ON comparisons (port_code, date)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS comparisons_by_month ON comparisons (month)")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS rollups (
+            provider TEXT NOT NULL, port TEXT NOT NULL, month TEXT NOT NULL, size TEXT NOT NULL,
+            min_price REAL, avg_price REAL, max_price REAL, tariff_lines INTEGER, runs INTEGER,
+            PRIMARY KEY (provider, port, month, size))""")
+        self._conn.commit()
+
+    def start_run(self, date=None, origin='comparacion.py'):
+        """Register a run and return its id; date is the tariff date (default: today)."""
+        run_at = pd.Timestamp.now().isoformat(timespec='seconds')
+        date = str(pd.Timestamp(date).date()) if date is not None else run_at[:10]
+        cursor = self._conn.execute("INSERT INTO runs (run_at, date, origin) VALUES (?, ?, ?)",
+                                    (run_at, date, origin))
+        return cursor.lastrowid
+
+    def _run_date(self, run_id):
+        return self._conn.execute("SELECT date FROM runs WHERE run_id = ?", (run_id,)).fetchone()[0]
+
+    def has_snapshot(self, provider, digest):
+        """Whether a frame with this digest was already stored for the provider."""
+        row = self._conn.execute("SELECT 1 FROM snapshots WHERE provider = ? AND digest = ? LIMIT 1",
+                                 (provider, digest)).fetchone()
+        return row is not None
+
+    def add_prices(self, run_id, provider, df):
+        """Append a cleaned provider frame, or one chunk of it, to a run."""
+        date = self._run_date(run_id)
+        columns = ['port_code', 'destino'] + list(CONTAINER_COLUMNS.values())
+        rows = ((run_id, provider, port_code, date, date[:7], destino, *prices)
+                for port_code, destino, *prices in df[columns].itertuples(index=False, name=None))
+        self._conn.executemany(
+            f"INSERT INTO prices VALUES ({', '.join('?' * (6 + len(CONTAINER_COLUMNS)))})",
+            ([_sql_value(value) for value in row] for row in rows))
+        snapshot = self._conn.execute("SELECT digest, rows FROM snapshots WHERE run_id = ? AND provider = ?",
+                                      (run_id, provider)).fetchone()
+        if snapshot is None:
+            self._conn.execute("INSERT INTO snapshots VALUES (?, ?, ?, ?)",
+                               (run_id, provider, frame_digest(df), len(df)))
         else:
-            row['fcl_20'] = np.nan
-            row['fcl_40'] = np.nan
-        
-        # Silver prices
-        if has_silver:
-            row['silver_20'] = silver_data.iloc[0]['veinte']
-            row['silver_40'] = silver_data.iloc[0]['cuarenta']
+            # Chunked runs: chain the chunk digests
+            digest = hashlib.sha1((snapshot[0] + frame_digest(df)).encode('utf-8')).hexdigest()
+            self._conn.execute("UPDATE snapshots SET digest = ?, rows = ? WHERE run_id = ? AND provider = ?",
+                               (digest, snapshot[1] + len(df), run_id, provider))
+
+    def add_comparison(self, run_id, df):
+        """Append comparison rows (or a batch of them) to a run."""
+        date = self._run_date(run_id)
+        columns = [column for column in self.COMPARISON_COLUMNS if column in df.columns]
+        rows = ([run_id, date, date[:7]] + [_sql_value(value) for value in row]
+                for row in df[columns].itertuples(index=False, name=None))
+        self._conn.executemany(
+            f"INSERT INTO comparisons (run_id, date, month, {', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * (3 + len(columns)))})", rows)
+
+    def has_run(self, origin):
+        """Whether a run with this origin was recorded."""
+        return self._conn.execute("SELECT 1 FROM runs WHERE origin = ? LIMIT 1", (origin,)).fetchone() is not None
+
+    def runs(self):
+        """Every run with its provider snapshots, oldest first."""
+        return pd.read_sql_query("""
+            SELECT runs.run_id, run_at, date, origin, provider, rows
+            FROM runs LEFT JOIN snapshots USING (run_id) ORDER BY runs.run_id, provider""", self._conn)
+
+    def prices(self, provider=None, port_code=None, start=None, end=None):
+        """Stored tariff rows, optionally for one provider and port and a date range (inclusive)."""
+        conditions, params = [], []
+        for column, value in [('provider', provider), ('port_code', port_code)]:
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            conditions.append("date >= ?")
+            params.append(str(pd.Timestamp(start).date()))
+        if end is not None:
+            conditions.append("date <= ?")
+            params.append(str(pd.Timestamp(end).date()))
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        return pd.read_sql_query(f"SELECT * FROM prices {where} ORDER BY provider, port_code, date, run_id",
+                                 self._conn, params=params)
+
+    def run_months(self, run_ids):
+        """Months (time partitions) of the given runs."""
+        placeholders = ', '.join('?' * len(run_ids))
+        rows = self._conn.execute(f"SELECT DISTINCT substr(date, 1, 7) FROM runs WHERE run_id IN ({placeholders})",
+                                  list(run_ids))
+        return sorted(month for month, in rows)
+
+    def refresh_rollups(self, months):
+        """
+        Recompute the rollups of the given months from their partition of prices.
+        Ports are keyed by port code, or by destination when a line has no code, and
+        only positive prices count, as in the comparison.
+        """
+        port = "COALESCE(NULLIF(port_code, ''), NULLIF(TRIM(destino), ''))"
+        for month in months:
+            self._conn.execute("DELETE FROM rollups WHERE month = ?", (month,))
+            for size, column in CONTAINER_COLUMNS.items():
+                self._conn.execute(f"""
+                    INSERT INTO rollups
+                    SELECT provider, {port} AS port, month, ?,
+                           MIN({column}), AVG({column}), MAX({column}), COUNT(*), COUNT(DISTINCT run_id)
+                    FROM prices
+                    WHERE month = ? AND {column} > 0 AND {port} IS NOT NULL
+                    GROUP BY provider, port""", (size, month))
+        self._conn.commit()
+
+    def rollups(self):
+        """Every monthly rollup, sorted by provider, port, size and month."""
+        return pd.read_sql_query("SELECT * FROM rollups ORDER BY provider, port, size, month", self._conn)
+
+    def commit(self):
+        self._conn.commit()
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
+
+def write_trends(store, months, path=TRENDS_CSV):
+    """Refresh the rollups of the given months and export all of them for the dashboard."""
+    store.refresh_rollups(months)
+    trends = store.rollups()
+    trends.to_csv(path, index=False)
+    write_artifact(trends, path)
+    return trends
+
+def _without_trailing_blanks(rows):
+    """Yield rows, holding back completely empty ones until a non-empty row follows."""
+    blanks = []
+    for row in rows:
+        if any(value is not None for value in row):
+            yield from blanks
+            blanks = []
+            yield row
         else:
-            row['silver_20'] = np.nan
-            row['silver_40'] = np.nan
-        
-        # Calculate differences and best prices for 20'
-        prices_20 = [p for p in [row.get('aires_20'), row.get('fcl_20'), row.get('silver_20')] if pd.notna(p) and p > 0]
-        if len(prices_20) >= 2:  # Need at least 2 valid prices for comparison
-            row['best_price_20'] = min(prices_20)
-            row['worst_price_20'] = max(prices_20)
-            row['price_diff_20'] = max(prices_20) - min(prices_20)
-            # Avoid division by zero
-            if min(prices_20) > 0:
-                row['price_diff_20_pct'] = (row['price_diff_20'] / min(prices_20)) * 100
-            else:
-                row['price_diff_20_pct'] = 0
-            
-            # Find best provider for 20'
-            if pd.notna(row.get('aires_20')) and row['aires_20'] > 0 and row['aires_20'] == row['best_price_20']:
-                row['best_provider_20'] = 'AiresDS'
-            elif pd.notna(row.get('fcl_20')) and row['fcl_20'] > 0 and row['fcl_20'] == row['best_price_20']:
-                row['best_provider_20'] = 'EXIM'
-            elif pd.notna(row.get('silver_20')) and row['silver_20'] > 0 and row['silver_20'] == row['best_price_20']:
-                row['best_provider_20'] = 'Silver'
-        
-        # Calculate differences and best prices for 40'
-        prices_40 = [p for p in [row.get('aires_40'), row.get('fcl_40'), row.get('silver_40')] if pd.notna(p) and p > 0]
-        if len(prices_40) >= 2:  # Need at least 2 valid prices for comparison
-            row['best_price_40'] = min(prices_40)
-            row['worst_price_40'] = max(prices_40)
-            row['price_diff_40'] = max(prices_40) - min(prices_40)
-            # Avoid division by zero
-            if min(prices_40) > 0:
-                row['price_diff_40_pct'] = (row['price_diff_40'] / min(prices_40)) * 100
-            else:
-                row['price_diff_40_pct'] = 0
-            
-            # Find best provider for 40'
-            if pd.notna(row.get('aires_40')) and row['aires_40'] > 0 and row['aires_40'] == row['best_price_40']:
-                row['best_provider_40'] = 'AiresDS'
-            elif pd.notna(row.get('fcl_40')) and row['fcl_40'] > 0 and row['fcl_40'] == row['best_price_40']:
-                row['best_provider_40'] = 'EXIM'
-            elif pd.notna(row.get('silver_40')) and row['silver_40'] > 0 and row['silver_40'] == row['best_price_40']:
-                row['best_provider_40'] = 'Silver'
-        
-        row['sources_available'] = sources_count
-        row['match_type'] = 'exact' if (aires_match == destino and fcl_match == destino and silver_match == destino) else 'fuzzy'
-        comparison_data.append(row)
-        
-        # Print matching info for fuzzy matches
-        if row['match_type'] == 'fuzzy':
-            matches_info = []
-            if has_aires and aires_match != destino:
-                matches_info.append(f"AiresDS: {aires_match}")
-            if has_fcl and fcl_match != destino:
-                matches_info.append(f"EXIM: {fcl_match}")
-            if has_silver and silver_match != destino:
-                matches_info.append(f"Silver: {silver_match}")
-            
-            if matches_info:
-                print(f"Fuzzy match found for '{destino}' -> {', '.join(matches_info)}")
-    
-    else:  # Destinations with no matches (only in one source)
-        source_name = 'AiresDS' if has_aires else ('EXIM' if has_fcl else 'Silver')
-        data = aires_data if has_aires else (fcl_data if has_fcl else silver_data)
-        original_dest = aires_match if has_aires else (fcl_match if has_fcl else silver_match)
-        
-        no_match_row = {
-            'destino': destino,
-            'original_destino': original_dest,
-            'port_code': current_port_code,
-            'source': source_name,
-            'veinte': data.iloc[0]['veinte'] if len(data) > 0 else np.nan,
-            'cuarenta': data.iloc[0]['cuarenta'] if len(data) > 0 else np.nan,
-            'reason': 'Only available in one source'
-        }
-        no_matches_data.append(no_match_row)
-
-# Create DataFrames
-comparison_df = pd.DataFrame(comparison_data)
-no_matches_df = pd.DataFrame(no_matches_data)
-
-# Sort by price difference for better analysis
-if not comparison_df.empty:
-    comparison_df = comparison_df.sort_values('price_diff_20_pct', ascending=False, na_position='last')
-
-# Create summary statistics
-summary_stats = {}
-if not comparison_df.empty:
-    # Filter out infinite values for statistics
-    valid_diff_20 = comparison_df['price_diff_20_pct'].replace([np.inf, -np.inf], np.nan).dropna()
-    valid_diff_40 = comparison_df['price_diff_40_pct'].replace([np.inf, -np.inf], np.nan).dropna()
-    
-    summary_stats = {
-        'total_destinations_compared': len(comparison_df),
-        'avg_price_diff_20_pct': valid_diff_20.mean() if len(valid_diff_20) > 0 else 0,
-        'max_price_diff_20_pct': valid_diff_20.max() if len(valid_diff_20) > 0 else 0,
-        'avg_price_diff_40_pct': valid_diff_40.mean() if len(valid_diff_40) > 0 else 0,
-        'max_price_diff_40_pct': valid_diff_40.max() if len(valid_diff_40) > 0 else 0,
-        'aires_best_count_20': (comparison_df['best_provider_20'] == 'AiresDS').sum(),
-        'fcl_best_count_20': (comparison_df['best_provider_20'] == 'EXIM').sum(),
-        'silver_best_count_20': (comparison_df['best_provider_20'] == 'Silver').sum(),
-        'aires_best_count_40': (comparison_df['best_provider_40'] == 'AiresDS').sum(),
-        'fcl_best_count_40': (comparison_df['best_provider_40'] == 'EXIM').sum(),
-        'silver_best_count_40': (comparison_df['best_provider_40'] == 'Silver').sum(),
+            blanks.append(row)
+
+def iter_provider_chunks(provider, chunk_rows=STREAM_CHUNK_ROWS):
+    """
+    Read a provider workbook chunk_rows rows at a time with openpyxl's read-only
+    mode and yield each chunk cleaned, so the sheet is never loaded whole.
+    Completely empty rows are kept, except at the end of the sheet, as pd.read_excel
+    does, so both readers give clean_provider the same rows.
+    """
+    from openpyxl import load_workbook
+    from openpyxl.cell.cell import ERROR_CODES
+
+    workbook = load_workbook(provider['file'], read_only=True, data_only=True)
+    try:
+        sheet = workbook[provider['sheet']] if 'sheet' in provider else workbook.worksheets[0]
+        # Formula errors (#VALUE!, #N/A...) become missing values, as in pd.read_excel
+        rows = (tuple(None if value in ERROR_CODES else value for value in row)
+                for row in sheet.iter_rows(values_only=True))
+        rows = _without_trailing_blanks(rows)
+        header = next(rows, None)
+        if header is None:
+            return
+        # Same names pandas gives to blank header cells
+        columns = [f'Unnamed: {i}' if name is None else name for i, name in enumerate(header)]
+        while True:
+            batch = list(islice(rows, chunk_rows))
+            if not batch:
+                break
+            yield clean_provider(pd.DataFrame(batch, columns=columns), provider)
+    finally:
+        workbook.close()
+
+class OutputWriter:
+    """
+    Append DataFrame batches to a CSV output and, optionally, to its Arrow IPC artifact.
+
+    Both are written to temporary files and moved into place by close(), so readers
+    never see a half written output. The artifact schema is taken from the first
+    batch: floats as float32, integers as int64 and everything else as strings
+    (categoricals would need the same dictionary in every batch).
+    """
+
+    def __init__(self, csv_path, artifact=True, artifact_dir=ARTIFACT_DIR):
+        self.csv_path = csv_path
+        self.artifact_path = artifact_path(csv_path, artifact_dir) if artifact else None
+        self.rows = 0
+        self._columns = None
+        self._schema = None
+        self._sink = None
+        self._writer = None
+        self._csv = open(csv_path + '.tmp', 'w', encoding='utf-8', newline='')
+
+    def _arrow_type(self, dtype):
+        if pd.api.types.is_float_dtype(dtype):
+            return pa.float32()
+        if pd.api.types.is_integer_dtype(dtype):
+            return pa.int64()
+        if pd.api.types.is_bool_dtype(dtype):
+            return pa.bool_()
+        return pa.string()
+
+    def _arrow_batch(self, df):
+        df = df.copy()
+        for field in self._schema:
+            if field.type == pa.string():
+                values = df[field.name]
+                df[field.name] = values.map(str, na_action='ignore').astype(object).where(values.notna(), None)
+            elif field.type == pa.float32():
+                df[field.name] = df[field.name].astype(np.float32)
+        return pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+
+    def append(self, df):
+        if self._columns is None:
+            self._columns = list(df.columns)
+            df.iloc[:0].to_csv(self._csv, index=False)
+        df = df[self._columns]
+        df.to_csv(self._csv, index=False, header=False)
+        self.rows += len(df)
+
+        if self.artifact_path is not None:
+            if self._writer is None:
+                os.makedirs(os.path.dirname(self.artifact_path), exist_ok=True)
+                self._schema = pa.schema([(column, self._arrow_type(df[column].dtype)) for column in self._columns])
+                self._sink = pa.OSFile(self.artifact_path + '.tmp', 'wb')
+                self._writer = pa.ipc.new_file(self._sink, self._schema)
+            self._writer.write_table(self._arrow_batch(df))
+
+    def close(self):
+        if self._columns is None:
+            self._csv.write('\n')  # what to_csv writes for an empty frame
+        self._csv.close()
+        os.replace(self.csv_path + '.tmp', self.csv_path)
+        if self._writer is not None:
+            self._writer.close()
+            self._sink.close()
+            os.replace(self.artifact_path + '.tmp', self.artifact_path)
+        elif self.artifact_path is not None and os.path.exists(self.artifact_path):
+            # No rows: drop the previous artifact so readers fall back to the CSV
+            os.remove(self.artifact_path)
+
+def build_stream_context(providers, join='destino', cache=None, chunk_rows=STREAM_CHUNK_ROWS,
+                         history=None, run_id=None):
+    """
+    First streaming pass: read every provider in chunks, write its cleaned data and
+    long price rows (and the history run, when given), and keep only what matching needs. That is the normalized name
+    and code per destination, the first prices per destination and one matcher and
+    port code index per provider. Returns the same context as build_match_context,
+    without the price table.
+    """
+    context = {'join': join, 'city_names': {}, 'port_codes': {},
+               'matchers': {}, 'code_indexes': {}, 'price_indexes': {}}
+    price_writer = OutputWriter('data/price_table.csv', artifact=False)
+    for provider in providers:
+        key = provider['key']
+        data_writer = OutputWriter(provider['data_csv'])
+        destinations, city_names = {}, {}
+        prices = {}
+        code_index = {}
+        for chunk in iter_provider_chunks(provider, chunk_rows):
+            context['city_names'].update(zip(chunk['destino'], chunk['city_name']))
+            context['port_codes'].update(zip(chunk['destino'], chunk['port_code']))
+            for destino, city_name in zip(chunk['destino'], chunk['city_name']):
+                destinations.setdefault(destino, city_name)
+            first_rows = chunk.dropna(subset=['destino']).drop_duplicates('destino')
+            for destino, *row_prices in zip(first_rows['destino'],
+                                            *(first_rows[CONTAINER_COLUMNS[size]] for size in CONTAINER_SIZES)):
+                prices.setdefault(destino, tuple(row_prices))
+            if join == 'port_code':
+                # Earlier chunks win, like the first row does within a chunk
+                for code, destino in build_port_code_index(chunk).items():
+                    code_index.setdefault(code, destino)
+
+            data_writer.append(chunk.drop(columns=['city_name']))
+            price_writer.append(build_price_table({key: chunk}))
+            if history is not None:
+                history.add_prices(run_id, key, chunk)
+        data_writer.close()
+
+        context['matchers'][key] = DestinationMatcher(list(destinations), MATCH_THRESHOLD,
+                                                      city_names=list(destinations.values()),
+                                                      cache=cache, provider=key)
+        context['code_indexes'][key] = code_index if join == 'port_code' else None
+        context['price_indexes'][key] = prices
+        print(f"Indexed {provider['file']}: {data_writer.rows} rows, {len(prices)} destinations")
+    price_writer.close()
+    return context
+
+def run_streaming(providers, join='destino', cache=None, chunk_rows=STREAM_CHUNK_ROWS, source_sheets=True,
+                  history=None):
+    """
+    Compare the providers without holding their frames or the results in memory.
+
+    After build_stream_context, each provider is read again chunk by chunk. Every
+    chunk's destinations are matched against the other providers' indexes and the
+    resulting comparison and no-match rows are appended to the outputs, so memory
+    is bounded by the chunk size plus the per-destination indexes. Rows come out in
+    file order rather than sorted by price difference. The Excel report is written
+    last, reading the CSV outputs back in chunks. With a PriceHistory, the chunks are
+    recorded as a new run and the price trends are refreshed.
+    Returns the summary statistics and the lookups resolved per matching stage.
+    """
+    labels = provider_labels(providers)
+    run_id = history.start_run() if history is not None else None
+    context = build_stream_context(providers, join, cache, chunk_rows, history, run_id)
+
+    comparison_writer = OutputWriter('data/price_comparison.csv')
+    no_matches_writer = OutputWriter('data/no_matches.csv')
+    matched_destinations = set()
+    stage_counts = Counter()
+    diff_totals = {size: [0, 0.0, None] for size in CONTAINER_SIZES}  # count, sum, max of finite diffs
+    best_counts = Counter()
+
+    print("Starting destination matching process...")
+    for provider in providers:
+        for chunk in iter_provider_chunks(provider, chunk_rows):
+            destinations = list(dict.fromkeys(chunk['destino']))
+            comparison_groups, no_match_groups, counts = match_destinations(
+                destinations, context, labels, matched_destinations)
+            stage_counts.update(counts)
+
+            if comparison_groups:
+                batch = comparison_frame([row for _, _, row in comparison_groups], labels)
+                comparison_writer.append(batch)
+                if history is not None:
+                    history.add_comparison(run_id, batch)
+                for size in CONTAINER_SIZES:
+                    diffs = batch[f'price_diff_{size}_pct'].replace([np.inf, -np.inf], np.nan).dropna()
+                    if len(diffs) > 0:
+                        totals = diff_totals[size]
+                        totals[0] += len(diffs)
+                        totals[1] += diffs.sum()
+                        totals[2] = diffs.max() if totals[2] is None else max(totals[2], diffs.max())
+                    best_counts.update((size, name) for name in batch[f'best_provider_{size}'].dropna())
+            if no_match_groups:
+                no_matches_writer.append(pd.DataFrame([row for _, _, row in no_match_groups]))
+
+    comparison_writer.close()
+    no_matches_writer.close()
+
+    summary_stats = {}
+    if comparison_writer.rows:
+        summary_stats = {'total_destinations_compared': comparison_writer.rows}
+        for size in CONTAINER_SIZES:
+            count, total, largest = diff_totals[size]
+            summary_stats[f'avg_price_diff_{size}_pct'] = total / count if count else 0
+            summary_stats[f'max_price_diff_{size}_pct'] = largest if count else 0
+        for size in CONTAINER_SIZES:
+            for key, name in labels.items():
+                summary_stats[f'{key}_best_count_{size}'] = best_counts[(size, name)]
+
+    summary_df = summary_frame(summary_stats)
+    summary_df.to_csv('data/summary_statistics.csv')
+    write_artifact(summary_df, 'data/summary_statistics.csv', index=True, typed=False)
+
+    def read_chunks(path):
+        def chunks():
+            try:
+                yield from pd.read_csv(path, chunksize=chunk_rows)
+            except pd.errors.EmptyDataError:
+                return  # An output without rows, written like to_csv writes an empty frame
+        return chunks
+
+    sheets = {
+        'Price Comparison': (read_chunks('data/price_comparison.csv'), False),
+        'No Matches': (read_chunks('data/no_matches.csv'), False),
+        'Summary Statistics': (summary_df, True),
     }
+    if source_sheets:
+        for provider in providers:
+            sheets[f"{provider['name']} Data"] = (read_chunks(provider['data_csv']), False)
+    write_report('price_comparison_report.xlsx', sheets, chunk_rows)
+    if history is not None:
+        write_trends(history, history.run_months([run_id]))
 
-# Save to Excel with multiple sheets
-with pd.ExcelWriter('price_comparison_report.xlsx', engine='openpyxl') as writer:
-    # Main comparison sheet
-    comparison_df.to_excel(writer, sheet_name='Price Comparison', index=False)
-    
-    # No matches sheet
-    no_matches_df.to_excel(writer, sheet_name='No Matches', index=False)
-    
-    # Summary statistics
-    summary_df = pd.DataFrame([summary_stats]).T
-    summary_df.columns = ['Value']
-    summary_df.to_excel(writer, sheet_name='Summary Statistics')
-    
+    print(f"Total destinations compared: {comparison_writer.rows}")
+    print(f"Destinations with no matches: {no_matches_writer.rows}")
+    print(f"Report saved as 'price_comparison_report.xlsx'")
+    print("CSV files saved in 'data' folder")
+    return summary_stats, stage_counts
+
+def match_providers(frames, labels, join='destino', cache=None, incremental=False):
+    """
+    Match stage: group the destinations of every provider. With incremental, the
+    groups of the previous run that the tariff changes cannot affect are carried
+    over. The state for the next incremental run is saved either way.
+    Returns the comparison and no-match groups, the lookups resolved per matching
+    stage and the match context.
+    """
+    all_destinations = set(d for df in frames.values() for d in df['destino'].tolist())
+    context = build_match_context(frames, join, cache)
+
+    # Incremental run: keep the previous groups untouched by the tariff changes
+    settings = {'providers': list(labels), 'join': join, 'threshold': MATCH_THRESHOLD}
+    row_hashes = compute_row_hashes(frames)
+    state = load_state() if incremental else None
+    carried_comparison = []
+    carried_no_matches = []
+    matched_destinations = set()
+    if state is not None and state['settings'] == settings:
+        changed = find_changed_destinations(state['row_hashes'], row_hashes)
+        carried_comparison = carry_over_groups(state['comparison'], changed, context)
+        carried_no_matches = carry_over_groups(state['no_matches'], changed, context)
+        for _, members, _ in carried_comparison + carried_no_matches:
+            matched_destinations |= members
+        changed_count = sum(len(d['added']) + len(d['removed']) + len(d['modified']) for d in changed.values())
+        print(f"Incremental run: {changed_count} tariff rows changed, "
+              f"{len(carried_comparison) + len(carried_no_matches)} groups carried over")
+    elif incremental:
+        print("Incremental run: no compatible previous state, running a full comparison")
+
+    print("Starting destination matching process...")
+    print(f"Total unique destinations found: {len(all_destinations)}")
+
+    comparison_groups, no_match_groups, stage_counts = match_destinations(
+        all_destinations, context, labels, matched_destinations)
+    comparison_groups = carried_comparison + comparison_groups
+    no_match_groups = carried_no_matches + no_match_groups
+
+    save_state({'settings': settings, 'row_hashes': row_hashes,
+                'comparison': comparison_groups, 'no_matches': no_match_groups})
+    return comparison_groups, no_match_groups, stage_counts, context
+
+def aggregate_results(comparison_groups, no_match_groups, frames, labels):
+    """
+    Aggregate stage: the comparison with its spreads, sorted by the 20' price
+    difference, the destinations without matches and the summary statistics.
+    Returns them with the provider frames stripped of their city_name matching key.
+    """
+    comparison_data = [row for _, _, row in comparison_groups]
+    no_matches_df = pd.DataFrame([row for _, _, row in no_match_groups])
+
+    # Best prices and spreads for all destinations at once, sorted for analysis
+    comparison_df = pd.DataFrame()
+    if comparison_data:
+        comparison_df = comparison_frame(comparison_data, labels)
+        comparison_df = comparison_df.sort_values('price_diff_20_pct', ascending=False, na_position='last')
+
+    summary_stats = summarize_comparison(comparison_df, labels)
+
+    # city_name is only a matching key, keep it out of the source data exports
+    frames = {key: df.drop(columns=['city_name']) for key, df in frames.items()}
+    return comparison_df, no_matches_df, summary_stats, frames
+
+def write_outputs(providers, comparison_df, no_matches_df, summary_stats, frames, price_table,
+                  source_sheets=True):
+    """Write stage: the Excel report, the CSVs in data/ and their Arrow artifacts."""
+    summary_df = summary_frame(summary_stats)
+
+    # Save to Excel with multiple sheets, streaming rows through a write-only workbook
+    sheets = {
+        'Price Comparison': (comparison_df, False),
+        'No Matches': (no_matches_df, False),
+        'Summary Statistics': (summary_df, True),
+    }
     # Individual source data for reference
-    airesds.to_excel(writer, sheet_name='AiresDS Data', index=False)
-    fcl.to_excel(writer, sheet_name='EXIM Data', index=False)
-    silver.to_excel(writer, sheet_name='Silver Data', index=False)
-
-# Save each sheet as CSV in data folder
-comparison_df.to_csv('data/price_comparison.csv', index=False)
-no_matches_df.to_csv('data/no_matches.csv', index=False)
-summary_df = pd.DataFrame([summary_stats]).T
-summary_df.columns = ['Value']
-summary_df.to_csv('data/summary_statistics.csv')
-airesds.to_csv('data/airesds_data.csv', index=False)
-fcl.to_csv('data/exim_data.csv', index=False)
-silver.to_csv('data/silver_data.csv', index=False)
-
-print("Price Comparison Report Generated with Improved Matching!")
-print(f"Total destinations compared: {len(comparison_df)}")
-print(f"Destinations with no matches: {len(no_matches_df)}")
-print(f"Report saved as 'price_comparison_report.xlsx'")
-print("CSV files saved in 'data' folder")
-
-# Count fuzzy matches
-if not comparison_df.empty and 'match_type' in comparison_df.columns:
-    fuzzy_matches = len(comparison_df[comparison_df['match_type'] == 'fuzzy'])
-    exact_matches = len(comparison_df[comparison_df['match_type'] == 'exact'])
-    print(f"Exact matches: {exact_matches}")
-    print(f"Fuzzy matches (improved matching): {fuzzy_matches}")
-
-# Display top 10 biggest price differences
-print("\nTop 10 destinations with biggest price differences (20' containers):")
-if not comparison_df.empty:
-    top_diffs = comparison_df.nlargest(10, 'price_diff_20_pct')[['destino', 'price_diff_20_pct', 'best_provider_20']]
-    print(top_diffs.to_string(index=False))
-
-# Display provider performance summary
-print(f"\nProvider Performance Summary (20' containers):")
-if 'aires_best_count_20' in summary_stats:
-    print(f"AiresDS best prices: {summary_stats['aires_best_count_20']}")
-    print(f"EXIM best prices: {summary_stats['fcl_best_count_20']}")
-    print(f"Silver best prices: {summary_stats['silver_best_count_20']}")
\ No newline at end of file
+    if source_sheets:
+        for provider in providers:
+            sheets[f"{provider['name']} Data"] = (frames[provider['key']], False)
+    write_report('price_comparison_report.xlsx', sheets)
+
+    # Save each sheet as CSV in data folder
+    comparison_df.to_csv('data/price_comparison.csv', index=False)
+    no_matches_df.to_csv('data/no_matches.csv', index=False)
+    summary_df.to_csv('data/summary_statistics.csv')
+    for provider in providers:
+        frames[provider['key']].to_csv(provider['data_csv'], index=False)
+    price_table.to_csv('data/price_table.csv', index=False)
+
+    # Typed columnar copies for the dashboard; the CSVs above stay for people
+    write_artifact(comparison_df, 'data/price_comparison.csv')
+    write_artifact(no_matches_df, 'data/no_matches.csv')
+    write_artifact(summary_df, 'data/summary_statistics.csv', index=True, typed=False)
+    for provider in providers:
+        write_artifact(frames[provider['key']], provider['data_csv'])
+
+def record_history(providers, frames, comparison_df, path=HISTORY_FILE):
+    """Append this run's tariffs and comparison to the price history and refresh the trends."""
+    store = PriceHistory(path)
+    run_id = store.start_run()
+    for provider in providers:
+        store.add_prices(run_id, provider['key'], frames[provider['key']])
+    store.add_comparison(run_id, comparison_df)
+    write_trends(store, store.run_months([run_id]))
+    store.close()
+
+def main(join='destino', provider_keys=None, incremental=False, match_cache=True, ingest_cache=True,
+         workers=None, stream=False, chunk_rows=STREAM_CHUNK_ROWS, source_sheets=True, history=True):
+    providers = get_providers(provider_keys)
+    labels = provider_labels(providers)
+
+    # Streaming mode: bounded memory for very large tariffs, see run_streaming
+    if stream:
+        if incremental:
+            raise ValueError("Incremental runs keep every group in memory and cannot be streamed")
+        cache = MatchCache(MATCH_CACHE_FILE, MATCH_THRESHOLD) if match_cache else None
+        store = PriceHistory(HISTORY_FILE) if history else None
+        start = time.perf_counter()
+        _, stage_counts = run_streaming(providers, join, cache, chunk_rows, source_sheets, store)
+        if cache is not None:
+            cache.close()
+            print(f"Match cache: {cache.hits} hits, {cache.misses} misses")
+        if store is not None:
+            store.close()
+            print(f"Run recorded in '{HISTORY_FILE}'")
+        print("Provider lookups resolved by stage:")
+        for stage in ['exact', 'port_code', 'fuzzy', 'unmatched']:
+            if stage in stage_counts:
+                print(f"  {stage}: {stage_counts[stage]}")
+        print(f"Streaming run finished in {time.perf_counter() - start:.3f}s")
+        return
+
+    # Read and clean data in parallel, from the Parquet cache when a workbook is unchanged
+    start = time.perf_counter()
+    frames, reports = ingest_providers(providers, workers, ingest_cache)
+    for report in reports:
+        print(f"Loaded {report['file']} from {report['source']} in {report['seconds']:.3f}s")
+    print(f"Ingested {len(reports)} workbooks in {time.perf_counter() - start:.3f}s "
+          f"({sum(r['seconds'] for r in reports):.3f}s of work)")
+
+    # Match, aggregate and write, each stage shared with the benchmark in rendimiento.py
+    cache = MatchCache(MATCH_CACHE_FILE, MATCH_THRESHOLD) if match_cache else None
+    comparison_groups, no_match_groups, stage_counts, context = match_providers(
+        frames, labels, join, cache, incremental)
+    if cache is not None:
+        cache.close()
+        print(f"Match cache: {cache.hits} hits, {cache.misses} misses")
+
+    comparison_df, no_matches_df, summary_stats, frames = aggregate_results(
+        comparison_groups, no_match_groups, frames, labels)
+    write_outputs(providers, comparison_df, no_matches_df, summary_stats, frames, context['price_table'],
+                  source_sheets)
+    if history:
+        record_history(providers, frames, comparison_df)
+
+    print("Price Comparison Report Generated with Improved Matching!")
+    print(f"Total destinations compared: {len(comparison_df)}")
+    print(f"Destinations with no matches: {len(no_matches_df)}")
+    print(f"Report saved as 'price_comparison_report.xlsx'")
+    print("CSV files saved in 'data' folder")
+    if history:
+        print(f"Run recorded in '{HISTORY_FILE}'")
+
+    # Count fuzzy matches
+    if not comparison_df.empty and 'match_type' in comparison_df.columns:
+        fuzzy_matches = len(comparison_df[comparison_df['match_type'] == 'fuzzy'])
+        exact_matches = len(comparison_df[comparison_df['match_type'] == 'exact'])
+        print(f"Exact matches: {exact_matches}")
+        print(f"Fuzzy matches (improved matching): {fuzzy_matches}")
+        if join == 'port_code':
+            port_code_matches = len(comparison_df[comparison_df['match_type'] == 'port_code'])
+            print(f"Port code matches: {port_code_matches}")
+
+    # Provider lookups resolved at each matching stage
+    print("Provider lookups resolved by stage:")
+    for stage in ['exact', 'port_code', 'fuzzy', 'unmatched']:
+        if stage in stage_counts:
+            print(f"  {stage}: {stage_counts[stage]}")
+
+    # Display top 10 biggest price differences
+    print("\nTop 10 destinations with biggest price differences (20' containers):")
+    if not comparison_df.empty:
+        top_diffs = comparison_df.nlargest(10, 'price_diff_20_pct')[['destino', 'price_diff_20_pct', 'best_provider_20']]
+        print(top_diffs.to_string(index=False))
+
+    # Display provider performance summary
+    print(f"\nProvider Performance Summary (20' containers):")
+    for key, name in labels.items():
+        if f'{key}_best_count_20' in summary_stats:
+            print(f"{name} best prices: {summary_stats[f'{key}_best_count_20']}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Compare ocean freight tariffs between providers.')
+    parser.add_argument('--join', choices=['destino', 'port_code'], default='destino',
+                        help="'port_code' resolves shared port codes before falling back to fuzzy matching")
+    parser.add_argument('--providers', type=lambda value: value.split(','),
+                        help='Comma separated provider keys from PROVIDERS (default: the enabled ones)')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Only re-match destinations whose tariff rows changed since the last run')
+    parser.add_argument('--no-match-cache', action='store_true',
+                        help='Score every fuzzy match again instead of reading data/match_cache.sqlite')
+    parser.add_argument('--no-ingest-cache', action='store_true',
+                        help='Parse every workbook instead of reading the cached copies in data/cache')
+    parser.add_argument('--workers', type=int,
+                        help='Processes used to read the workbooks (default: one per provider, 1 = sequential)')
+    parser.add_argument('--no-source-sheets', action='store_true',
+                        help='Leave the per-provider source data sheets out of the Excel report')
+    parser.add_argument('--stream', action='store_true',
+                        help='Read, match and write in chunks so memory does not grow with the tariff size')
+    parser.add_argument('--chunk-rows', type=int, default=STREAM_CHUNK_ROWS,
+                        help=f'Workbook rows per chunk in --stream mode (default: {STREAM_CHUNK_ROWS})')
+    parser.add_argument('--no-history', action='store_true',
+                        help=f'Do not record this run in {HISTORY_FILE}')
+    args = parser.parse_args()
+    main(join=args.join, provider_keys=args.providers, incremental=args.incremental,
+         match_cache=not args.no_match_cache, ingest_cache=not args.no_ingest_cache,
+         workers=args.workers, stream=args.stream, chunk_rows=args.chunk_rows,
+         source_sheets=not args.no_source_sheets, history=not args.no_history)
@@ -0,0 +1,398 @@
+"""
+Aggregates behind the dashboard, computed once per data version and shared by every
+session in the process.
+
+app.py only asks this module for ready-made views (port index, chart model, no-match
+filters), so concurrent viewers reuse the same results instead of recomputing them.
+The same queries can be served as JSON over HTTP:
+
+    python consultas.py --port 8502
+"""
+import io
+import os
+import time
+import hashlib
+import functools
+import threading
+import numpy as np
+import pandas as pd
+from comparacion import (PROVIDERS, CONTAINER_SIZES, TRENDS_CSV, file_digest, artifact_path, read_artifact,
+                         write_report)
+
+# Rows written per chunk by export
+EXPORT_CHUNK_ROWS = 50_000
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+}
+
+_lock = threading.Lock()
+_datasets = {}  # path -> (mtime_ns, size, digest, frame)
+_results = {}   # (query, version, args) -> result
+
+def read_dataset(path, index_col=None):
+    """
+    Read an output of comparacion.py, preferring its typed Arrow copy over the CSV.
+    The copy is only used when it is at least as new as the CSV, since comparacion.py
+    always writes it last; a CSV written afterwards (by hand, or by a run that left the
+    copy behind) is read instead. The file is hashed again only when its mtime or size
+    change, and parsed again only when its contents do. Returns the frame and the
+    content digest.
+    """
+    arrow_path = artifact_path(path)
+    if os.path.exists(arrow_path) and (not os.path.exists(path) or
+                                       os.stat(arrow_path).st_mtime_ns >= os.stat(path).st_mtime_ns):
+        path = arrow_path
+    stat = os.stat(path)
+    with _lock:
+        cached = _datasets.get(path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[3], cached[2]
+
+    digest = file_digest(path)
+    if cached and cached[2] == digest:
+        df = cached[3]
+    elif path == arrow_path:
+        df = read_artifact(path)
+    else:
+        df = pd.read_csv(path, index_col=index_col)
+    with _lock:
+        _datasets[path] = (stat.st_mtime_ns, stat.st_size, digest, df)
+    return df, digest
+
+def load_data():
+    """
+    Current comparison outputs and their version (a digest of every file read).
+    Raises FileNotFoundError until comparacion.py has been run.
+    """
+    start = time.perf_counter()
+    comparison_df, comparison_hash = read_dataset('data/price_comparison.csv')
+    no_matches_df, no_matches_hash = read_dataset('data/no_matches.csv')
+    summary_stats, summary_hash = read_dataset('data/summary_statistics.csv', index_col=0)
+    hashes = [comparison_hash, no_matches_hash, summary_hash]
+
+    # Providers that took part in the last comparison run
+    providers = [p for p in PROVIDERS if f"{p['key']}_20" in comparison_df.columns]
+    provider_frames = {}
+    for p in providers:
+        provider_frames[p['key']], provider_hash = read_dataset(p['data_csv'])
+        hashes.append(provider_hash)
+
+    return {
+        'comparison': comparison_df,
+        'no_matches': no_matches_df,
+        'summary': summary_stats,
+        'providers': providers,
+        'provider_frames': provider_frames,
+        'version': hashlib.sha1(''.join(hashes).encode('utf-8')).hexdigest()[:10],
+        'updated': max(os.path.getmtime('data/price_comparison.csv'), os.path.getmtime('data/summary_statistics.csv')),
+        'load_seconds': time.perf_counter() - start,
+    }
+
+def per_version(query):
+    """Cache query(data, *args) per data version and arguments for the whole process."""
+    @functools.wraps(query)
+    def cached_query(data, *args):
+        key = (query.__name__, data['version'], args)
+        with _lock:
+            if key in _results:
+                return _results[key]
+        result = query(data, *args)
+        with _lock:
+            # Results of this query for older data versions can no longer be asked for
+            for stale in [k for k in _results if k[0] == key[0] and k[1] != data['version']]:
+                del _results[stale]
+            _results[key] = result
+        return result
+    return cached_query
+
+@per_version
+def port_index(data):
+    """
+    Comparison rows by port code: row positions in file order, sorted destinations per
+    port and the first row of every destination, so the port and destination filters
+    are dictionary lookups.
+    """
+    df = data['comparison']
+    destinos = df['destino'].to_numpy(dtype=object)
+    ports = df['port_code'].to_numpy(dtype=object) if 'port_code' in df.columns else None
+
+    rows, destinos_by_port = {}, {}
+    if ports is not None:
+        valid = pd.notna(ports) & (ports != "")
+        valid_rows = np.flatnonzero(valid)
+        groups = pd.Series(valid_rows).groupby(ports[valid]).indices
+        rows = {port: valid_rows[positions] for port, positions in groups.items()}
+        destinos_by_port = {port: sorted(set(destinos[positions])) for port, positions in rows.items()}
+
+    # First row of each destination, as the original iloc[0] lookup
+    first_rows = pd.Series(np.arange(len(destinos))).groupby(destinos, sort=False).first()
+    return {
+        'ports': sorted(rows),
+        'rows': rows,
+        'destinos': destinos_by_port,
+        'all_destinos': sorted(set(destinos)),
+        'destino_row': first_rows.to_dict(),
+    }
+
+@per_version
+def chart_model(data):
+    """
+    Everything the summary and provider tabs draw, per container size: the rows with a
+    finite percentage difference, hover labels, average/max difference, top 10 table and
+    best-provider counts. Also the average price per provider.
+    """
+    df = data['comparison']
+    sizes = {}
+    for size in CONTAINER_SIZES:
+        if f'price_diff_{size}_pct' not in df.columns:
+            continue
+        valid = df[df[f'price_diff_{size}_pct'].replace([np.inf, -np.inf], np.nan).notna()]
+        diffs = valid[f'price_diff_{size}_pct']
+
+        # Hover text: destination plus the port code in parentheses when there is one
+        hover = valid['destino'].astype('string')
+        if 'port_code' in valid.columns:
+            port = valid['port_code'].astype('string').fillna('')
+            hover = hover + (' (' + port + ')').where(port != '', '')
+
+        top = valid.nlargest(10, f'price_diff_{size}_pct')[
+            ['destino', 'port_code', f'best_price_{size}', f'worst_price_{size}', f'price_diff_{size}_pct', f'best_provider_{size}']
+        ].round(2)
+        top.columns = ['Destino', 'Puerto', 'Mejor Precio', 'Peor Precio', 'Diferencia %', 'Mejor Proveedor']
+
+        # Categorical columns also count the providers that never win
+        best_counts = df[f'best_provider_{size}'].value_counts()
+        best_counts = best_counts[best_counts > 0]
+        sizes[size] = {
+            'valid': valid,
+            'hover': hover.tolist(),
+            'avg_diff': diffs.mean() if len(diffs) > 0 else 0.0,
+            'max_diff': diffs.max() if len(diffs) > 0 else 0.0,
+            'top': top,
+            'best_counts': best_counts,
+            'performance': pd.DataFrame({
+                'Proveedor': best_counts.index,
+                'Mejores Precios': best_counts.values,
+                'Porcentaje': (best_counts.values / best_counts.sum() * 100).round(1)
+            }),
+        }
+
+    avg_prices = pd.DataFrame([
+        {'Proveedor': p['name'], **{f"Promedio {size}'": df[f"{p['key']}_{size}"].mean() for size in CONTAINER_SIZES}}
+        for p in data['providers']
+    ])
+    return {'sizes': sizes, 'avg_prices': avg_prices}
+
+@per_version
+def no_match_options(data):
+    """Port codes and sources offered by the no-match filters."""
+    df = data['no_matches']
+    ports = []
+    if 'port_code' in df.columns:
+        ports = sorted([code for code in df['port_code'].unique() if pd.notna(code) and code != ""])
+    return {'ports': ports, 'sources': df['source'].unique().tolist()}
+
+@per_version
+def no_match_view(data, port=None, source=None):
+    """
+    No-match rows for a port code and/or source (None means all), with their
+    distribution by source and the detail table shown by the dashboard.
+    """
+    df = data['no_matches']
+    if port is not None and 'port_code' in df.columns:
+        df = df[df['port_code'] == port]
+    if source is not None:
+        df = df[df['source'] == source]
+
+    source_dist = df['source'].value_counts()
+    source_dist = source_dist[source_dist > 0]
+
+    if 'port_code' in df.columns:
+        detail = df[['destino', 'port_code', 'source', 'veinte', 'cuarenta']].copy()
+        detail.columns = ['Destino', 'Puerto', 'Fuente', 'Precio 20\'', 'Precio 40\'']
+    else:
+        detail = df[['destino', 'source', 'veinte', 'cuarenta']].copy()
+        detail.columns = ['Destino', 'Fuente', 'Precio 20\'', 'Precio 40\'']
+
+    return {
+        'source_dist': source_dist,
+        'source_table': pd.DataFrame({
+            'Fuente': source_dist.index,
+            'Cantidad': source_dist.values,
+            'Porcentaje': (source_dist.values / source_dist.sum() * 100).round(1)
+        }),
+        'detail': detail.fillna('N/A'),
+    }
+
+@per_version
+def dataset_view(data, dataset, port=None, source=None):
+    """
+    One dataset as the dashboard shows it: 'comparison', 'no_matches', 'summary' or a
+    provider key, optionally narrowed to a port code (comparison, no_matches) and a
+    source (no_matches).
+    """
+    if dataset == 'comparison':
+        df = data['comparison']
+        if port is not None:
+            df = df.iloc[port_index(data)['rows'].get(port, [])]
+        return df
+    if dataset == 'no_matches':
+        df = data['no_matches']
+        if port is not None and 'port_code' in df.columns:
+            df = df[df['port_code'] == port]
+        if source is not None:
+            df = df[df['source'] == source]
+        return df
+    if dataset == 'summary':
+        return data['summary']
+    return data['provider_frames'][dataset]
+
+def load_trends():
+    """
+    Monthly price rollups written by comparacion.py from the price history, with
+    their version, or None until a run has been recorded.
+    """
+    if not os.path.exists(TRENDS_CSV):
+        return None
+    df, digest = read_dataset(TRENDS_CSV)
+    return {'trends': df, 'version': digest[:10]}
+
+@per_version
+def trend_index(trends):
+    """Ports with rollups, sorted, and the rollup row positions of every (port, size)."""
+    df = trends['trends']
+    groups = df.groupby([df['port'].astype(str), df['size'].astype(str)], sort=False).indices
+    return {'ports': sorted({port for port, _ in groups}), 'rows': groups}
+
+@per_version
+def trend_view(trends, port, size):
+    """Monthly min/avg/max prices of one port and container size, one series per provider."""
+    df = trends['trends']
+    rows = trend_index(trends)['rows'].get((port, size), [])
+    names = {p['key']: p['name'] for p in PROVIDERS}
+    view = pd.DataFrame({
+        'Proveedor': df['provider'].iloc[rows].astype(str).map(names).to_numpy(),
+        'Mes': pd.to_datetime(df['month'].iloc[rows].astype(str), format='%Y-%m').to_numpy(),
+        'Mínimo': df['min_price'].iloc[rows].to_numpy(dtype=float),
+        'Promedio': df['avg_price'].iloc[rows].to_numpy(dtype=float),
+        'Máximo': df['max_price'].iloc[rows].to_numpy(dtype=float),
+        'Corridas': df['runs'].iloc[rows].to_numpy(),
+    })
+    return view.sort_values(['Proveedor', 'Mes'], ignore_index=True)
+
+def _chunks(df):
+    # At least one chunk, so an empty dataset still gets its header
+    rows = EXPORT_CHUNK_ROWS
+    for start in range(0, max(len(df), 1), rows):
+        yield df.iloc[start:start + rows]
+
+def _write_csv(df, buffer, index):
+    for number, chunk in enumerate(_chunks(df)):
+        buffer.write(chunk.to_csv(index=index, header=number == 0).encode('utf-8'))
+
+def _write_xlsx(df, buffer, index):
+    write_report(buffer, {'Datos': (lambda: _chunks(df), index)})
+
+def _write_parquet(df, buffer, index):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    writer = None
+    for chunk in _chunks(df):
+        table = pa.Table.from_pandas(chunk, preserve_index=index)
+        if writer is None:
+            writer = pq.ParquetWriter(buffer, table.schema)
+        writer.write_table(table)
+    writer.close()
+
+@per_version
+def export(data, dataset, fmt, port=None, source=None):
+    """
+    A dataset view (see dataset_view) encoded as 'csv', 'xlsx' or 'parquet', written
+    EXPORT_CHUNK_ROWS rows at a time. Built on first request and then shared per data version.
+    """
+    writers = {'csv': _write_csv, 'xlsx': _write_xlsx, 'parquet': _write_parquet}
+    if fmt not in writers:
+        raise KeyError(fmt)
+    df = dataset_view(data, dataset, port, source)
+    buffer = io.BytesIO()
+    # Only the summary keeps its index (the statistic names), as in summary_statistics.csv
+    writers[fmt](df, buffer, dataset == 'summary')
+    return buffer.getvalue()
+
+
+def _records(df):
+    """JSON friendly rows; NaN and inf become null."""
+    # float32 prices go through their shortest text form, so 295.77 is not sent as 295.7699890136719
+    df = df.astype({column: str for column in df.columns if df[column].dtype == np.float32}).astype(
+        {column: float for column in df.columns if df[column].dtype == np.float32})
+    df = df.astype(object).replace([np.inf, -np.inf], np.nan)
+    return df.where(pd.notna(df), None).to_dict(orient='records')
+
+def handle(path, params):
+    """Answer one JSON query; raises KeyError for unknown paths or values."""
+    data = load_data()
+    parts = [part for part in path.split('/') if part]
+    if parts == ['version']:
+        return {'version': data['version'], 'updated': data['updated']}
+    if parts == ['ports']:
+        return port_index(data)['ports']
+    if len(parts) == 2 and parts[0] == 'ports':
+        return _records(data['comparison'].iloc[port_index(data)['rows'][parts[1]]])
+    if parts == ['avg_prices']:
+        return _records(chart_model(data)['avg_prices'])
+    if len(parts) == 3 and parts[0] == 'sizes' and parts[2] in ('top', 'performance'):
+        return _records(chart_model(data)['sizes'][parts[1]][parts[2]])
+    if parts == ['no_matches']:
+        view = no_match_view(data, params.get('port'), params.get('source'))
+        return {'sources': _records(view['source_table']), 'rows': _records(view['detail'])}
+    if len(parts) == 2 and parts[0] == 'trends':
+        trends = load_trends()
+        if trends is None:
+            raise KeyError(path)
+        view = trend_view(trends, parts[1], params.get('size', CONTAINER_SIZES[0]))
+        return _records(view.assign(Mes=view['Mes'].dt.strftime('%Y-%m')))
+    raise KeyError(path)
+
+def serve(host='127.0.0.1', port=8502):
+    """Serve the queries as JSON; every request thread shares this process' cache."""
+    import json
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit, parse_qsl
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlsplit(self.path)
+            try:
+                status, body = 200, handle(url.path, dict(parse_qsl(url.query)))
+            except KeyError as e:
+                status, body = 404, {'error': f'Not found: {e}'}
+            except FileNotFoundError as e:
+                status, body = 503, {'error': f'Run comparacion.py first: {e}'}
+            payload = json.dumps(body, ensure_ascii=False, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    print(f"Serving dashboard queries on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Serve the dashboard aggregates as JSON.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8502)
+    args = parser.parse_args()
+    serve(args.host, args.port)
@@ -0,0 +1,208 @@
+"""
+Tariff diff between two versions of a provider tariff or two comparison runs.
+
+Destinations are aligned with a hash join on their normalized name (or port code)
+and every price column gets its absolute and percentage change, all with column
+operations, so a 100k-row tariff diffs in about a second:
+
+    python diferencias.py silver_viejo.xlsx silver.xlsx
+    python diferencias.py data/versiones_viejas/price_comparison.csv data/price_comparison.csv --on port_code
+"""
+import numpy as np
+import pandas as pd
+from comparacion import (PROVIDERS, CONTAINER_COLUMNS, clean_provider, extract_city_names,
+                         extract_port_codes, write_report)
+from historial import legacy_provider
+
+STATUSES = ['changed', 'added', 'removed', 'unchanged']
+
+def is_comparison(df):
+    """Whether a frame is a price_comparison output rather than a provider tariff."""
+    return 'best_price_20' in df.columns
+
+def load_version(path, provider=None):
+    """
+    Read one side of a diff. Comparison CSVs are used as they are; provider tariffs,
+    raw workbooks or exported CSVs, are cleaned with the provider's current rules.
+    provider is a registry key; by default it is guessed from the file name.
+    """
+    if path.endswith('.csv'):
+        raw = pd.read_csv(path)
+        if is_comparison(raw):
+            return raw
+    if provider is not None:
+        entry = {p['key']: p for p in PROVIDERS}[provider]
+    else:
+        entry = legacy_provider(path)
+        if entry is None:
+            raise ValueError(f"Cannot tell which provider {path} belongs to, pass --provider")
+    if not path.endswith('.csv'):
+        raw = pd.read_excel(path, sheet_name=entry.get('sheet', 0))
+    return clean_provider(raw, entry).drop(columns=['city_name'])
+
+def price_columns(df):
+    """Price columns of a provider frame or a comparison (provider prices, best and worst)."""
+    if not is_comparison(df):
+        return list(CONTAINER_COLUMNS.values())
+    sizes = tuple(f'_{size}' for size in CONTAINER_COLUMNS)
+    return [c for c in df.columns if c.endswith(sizes) and not c.startswith('price_diff')
+            and not c.startswith('best_provider') and pd.api.types.is_numeric_dtype(df[c])]
+
+def diff_keys(df, on='destino'):
+    """
+    Join keys per row: the normalized city name and, with on='port_code', the port
+    code where there is one (the city name otherwise).
+    """
+    city = extract_city_names(df['destino'])
+    key = city
+    if on == 'port_code':
+        codes = df['port_code'] if 'port_code' in df.columns else extract_port_codes(df['destino'])
+        codes = codes.fillna('').astype(str)
+        key = codes.where(codes != '', city)
+    return pd.DataFrame({'key': key.to_numpy(), 'city': city.to_numpy()})
+
+def _join(old, new, columns):
+    """
+    Outer hash join of two sides on columns. Repeated keys are numbered in file order
+    so duplicated destinations pair up instead of multiplying.
+    """
+    old = old.assign(occurrence=old.groupby(columns, sort=False).cumcount())
+    new = new.assign(occurrence=new.groupby(columns, sort=False).cumcount())
+    return old.merge(new, on=columns + ['occurrence'], how='outer', suffixes=('_old', '_new'),
+                     indicator=True, sort=False)
+
+def align_versions(old, new, on='destino'):
+    """
+    Pair the rows of two sides built by diff_versions.
+
+    Rows join on the normalized city name. With on='port_code' the rows left over
+    join again on the port code, so renamed destinations of the same port pair up
+    while destinations sharing a port still pair by name first.
+    """
+    merged = _join(old, new, ['key', 'city'])
+    if on == 'port_code':
+        left = merged['_merge'] == 'left_only'
+        right = merged['_merge'] == 'right_only'
+        if left.any() and right.any():
+            def leftovers(rows, suffix, other):
+                rows = rows.drop(columns=[c for c in rows.columns if c.endswith(other)] + ['occurrence', '_merge'])
+                return rows.rename(columns=lambda c: c[:-len(suffix)] if c.endswith(suffix) else c)
+            rejoined = _join(leftovers(merged[left], '_old', '_new'), leftovers(merged[right], '_new', '_old'),
+                             ['key'])
+            rejoined['city'] = rejoined['city_new'].fillna(rejoined['city_old'])
+            merged = pd.concat([merged[~(left | right)], rejoined.drop(columns=['city_old', 'city_new'])],
+                               ignore_index=True)
+    return merged
+
+def diff_versions(old, new, on='destino'):
+    """
+    Align two versions of a tariff (or two comparisons) and compute the price changes.
+
+    Returns one row per aligned destination with its status (changed, added, removed
+    or unchanged), the old and new destination text and, per price column shared by
+    both versions, the old and new price, the change and the change in percent of
+    the old price. As in the comparison, only positive prices count; a price that
+    appears or disappears marks the row as changed with an empty delta.
+    """
+    columns = [c for c in price_columns(old) if c in set(price_columns(new))]
+    sides = []
+    for df in [old, new]:
+        side = diff_keys(df, on)
+        side['destino'] = df['destino'].to_numpy()
+        side['port_code'] = df['port_code'].to_numpy() if 'port_code' in df.columns else ''
+        for column in columns:
+            side[column] = df[column].to_numpy(dtype=float)
+        sides.append(side)
+
+    merged = align_versions(sides[0], sides[1], on)
+    result = pd.DataFrame({
+        'key': merged['key'],
+        'destino_old': merged['destino_old'],
+        'destino_new': merged['destino_new'],
+        'port_code': merged['port_code_new'].fillna(merged['port_code_old']),
+    })
+
+    changed = np.zeros(len(merged), dtype=bool)
+    largest_pct = np.full(len(merged), np.nan)
+    for column in columns:
+        before = merged[f'{column}_old'].to_numpy()
+        after = merged[f'{column}_new'].to_numpy()
+        before = np.where(before > 0, before, np.nan)
+        after = np.where(after > 0, after, np.nan)
+        delta = after - before
+        with np.errstate(invalid='ignore'):
+            delta_pct = delta / before * 100
+        # Different prices, or a price on one side only
+        changed |= (np.isnan(before) != np.isnan(after)) | ((delta != 0) & ~np.isnan(delta))
+        largest_pct = np.fmax(largest_pct, np.abs(delta_pct))
+        result[f'{column}_old'] = before
+        result[f'{column}_new'] = after
+        result[f'{column}_delta'] = delta
+        result[f'{column}_delta_pct'] = delta_pct
+
+    side = merged['_merge'].to_numpy()
+    result['status'] = np.select([side == 'right_only', side == 'left_only', changed],
+                                 ['added', 'removed', 'changed'], 'unchanged')
+    result['largest_change_pct'] = largest_pct
+    result = result.sort_values(['status', 'largest_change_pct'], ascending=[True, False], na_position='last',
+                                key=lambda s: s.map(STATUSES.index) if s.name == 'status' else s)
+    return result.reset_index(drop=True)
+
+def diff_summary(diff):
+    """Rows per status plus the average and extreme price changes of the changed rows."""
+    counts = diff['status'].value_counts()
+    summary = {f'{status}_destinations': int(counts.get(status, 0)) for status in STATUSES}
+    changed = diff[diff['status'] == 'changed']
+    for column in [c[:-len('_delta_pct')] for c in diff.columns if c.endswith('_delta_pct')]:
+        pct = changed[f'{column}_delta_pct'].dropna()
+        summary[f'{column}_avg_delta_pct'] = pct.mean() if len(pct) > 0 else 0
+        summary[f'{column}_max_increase_pct'] = pct.max() if len(pct) > 0 else 0
+        summary[f'{column}_max_decrease_pct'] = pct.min() if len(pct) > 0 else 0
+    return summary
+
+def write_diff_report(diff, path):
+    """Excel change report: changed, added and removed destinations plus the summary."""
+    summary_df = pd.DataFrame([diff_summary(diff)]).T
+    summary_df.columns = ['Value']
+    sheets = {
+        'Changed': (diff[diff['status'] == 'changed'], False),
+        'Added': (diff[diff['status'] == 'added'], False),
+        'Removed': (diff[diff['status'] == 'removed'], False),
+        'Summary': (summary_df, True),
+    }
+    write_report(path, sheets)
+
+
+if __name__ == '__main__':
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description='Diff two versions of a provider tariff or of the comparison.')
+    parser.add_argument('old', help='Previous version: provider workbook, provider CSV or price_comparison.csv')
+    parser.add_argument('new', help='Current version, same kind as the previous one')
+    parser.add_argument('--provider', choices=[p['key'] for p in PROVIDERS],
+                        help='Provider of the tariffs (default: guessed from the file names)')
+    parser.add_argument('--on', choices=['destino', 'port_code'], default='destino',
+                        help="Align on the normalized destination, or on the port code where there is one")
+    parser.add_argument('--output', default='tariff_diff_report.xlsx', help='Excel change report')
+    parser.add_argument('--csv', help='Also write every aligned row to this CSV')
+    args = parser.parse_args()
+
+    old, new = load_version(args.old, args.provider), load_version(args.new, args.provider)
+    if is_comparison(old) != is_comparison(new):
+        parser.error('Both versions must be provider tariffs or both comparisons')
+    start = time.perf_counter()
+    diff = diff_versions(old, new, args.on)
+    print(f"Aligned {len(old)} and {len(new)} rows in {time.perf_counter() - start:.3f}s")
+
+    write_diff_report(diff, args.output)
+    if args.csv:
+        diff.to_csv(args.csv, index=False)
+    for name, value in diff_summary(diff).items():
+        print(f"{name}: {value:.2f}" if isinstance(value, float) else f"{name}: {value}")
+    print(f"Report saved as '{args.output}'")
+
+    top = diff[diff['status'] == 'changed'].head(10)
+    if not top.empty:
+        print("\nBiggest price changes:")
+        print(top[['destino_new', 'largest_change_pct']].to_string(index=False))
@@ -0,0 +1,163 @@
+"""
+Price history kept by comparacion.py in data/history.sqlite (see PriceHistory).
+
+Every pipeline run records itself. This script imports the snapshots kept by hand
+before the history existed and queries what is stored:
+
+    python historial.py import
+    python historial.py import inputs_viejos=2025-06-01 silver_viejo.xlsx=2025-07-01
+    python historial.py runs
+    python historial.py series --provider fcl --port AEJEA
+"""
+import os
+import subprocess
+import pandas as pd
+from comparacion import PROVIDERS, HISTORY_FILE, PriceHistory, clean_provider, frame_digest, write_trends
+
+# Snapshots saved before the history existed: output folders, input folders or single workbooks
+LEGACY_SNAPSHOTS = ['data/versiones_viejas', 'inputs_viejos', 'silver_viejo.xlsx']
+
+def legacy_provider(path):
+    """
+    Registry entry a snapshot file belongs to, or None.
+
+    A file belongs to the provider whose workbook or data CSV name starts its own
+    name (fclviejo.xlsx -> fcl.xlsx, exim_data.csv -> data/exim_data.csv); the
+    longest such name wins, so silverfreight files do not go to silver.
+    """
+    name = os.path.basename(path).lower()
+    best, best_length = None, 0
+    for provider in PROVIDERS:
+        for stem in [provider['file'], provider['data_csv']]:
+            stem = os.path.splitext(os.path.basename(stem))[0].lower()
+            if name.startswith(stem) and len(stem) > best_length:
+                best, best_length = provider, len(stem)
+    return best
+
+def read_snapshot_file(path, provider):
+    """Clean a snapshot with the current rules, whether it is a raw workbook or an exported CSV."""
+    if path.endswith('.csv'):
+        raw = pd.read_csv(path)
+    else:
+        raw = pd.read_excel(path, sheet_name=provider.get('sheet', 0))
+    return clean_provider(raw, provider)
+
+def snapshot_files(source):
+    """Files of a snapshot source (a folder or a single file), sorted by name."""
+    if os.path.isdir(source):
+        return sorted(os.path.join(source, name) for name in os.listdir(source)
+                      if name.endswith(('.csv', '.xlsx')))
+    return [source]
+
+def parse_source(text):
+    """Split a 'path=YYYY-MM-DD' command line source into (path, date); the date is optional."""
+    path, separator, date = text.rpartition('=')
+    if not separator:
+        return text, None
+    try:
+        return path, pd.Timestamp(date).strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Invalid date '{date}' for snapshot '{path}', expected YYYY-MM-DD")
+
+def git_commit_date(path):
+    """Date (YYYY-MM-DD) of the last commit touching path, or None when git does not track it."""
+    directory, name = os.path.split(os.path.abspath(path))
+    try:
+        result = subprocess.run(['git', 'log', '-1', '--format=%cs', '--', name], cwd=directory,
+                                capture_output=True, text=True, check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return result.stdout.strip() or None
+
+def import_snapshot(store, source, date=None):
+    """
+    Record one legacy snapshot source as a run dated date.
+
+    Without a date, the run is dated by the last git commit touching the source, as
+    file mtimes only tell when the repository was checked out. Raises ValueError when
+    the source is not committed either, rather than guessing.
+
+    Provider frames already stored with the same contents are skipped, as the same
+    tariff is often kept both as a workbook and as its exported CSV, and a source
+    that was imported before is skipped entirely. A price_comparison.csv in the
+    source is stored as the run's comparison. Returns the run id, or None when
+    there was nothing new.
+    """
+    origin = f'legacy:{source}'
+    if store.has_run(origin):
+        return None
+    if date is None:
+        date = git_commit_date(source)
+    if date is None:
+        raise ValueError(f"No date for snapshot '{source}': it is not committed to git, "
+                         f"pass it as {source}=YYYY-MM-DD")
+
+    frames = {}
+    comparison = None
+    for path in snapshot_files(source):
+        if os.path.basename(path) == 'price_comparison.csv':
+            comparison = pd.read_csv(path)
+            continue
+        provider = legacy_provider(path)
+        if provider is None:
+            continue
+        df = read_snapshot_file(path, provider)
+        if provider['key'] in frames or store.has_snapshot(provider['key'], frame_digest(df)):
+            continue
+        frames[provider['key']] = df
+
+    if not frames and comparison is None:
+        return None
+    run_id = store.start_run(date, origin)
+    for key, df in frames.items():
+        store.add_prices(run_id, key, df)
+    if comparison is not None:
+        store.add_comparison(run_id, comparison)
+    store.commit()
+    return run_id
+
+def import_legacy(store, sources=LEGACY_SNAPSHOTS, dates=None):
+    """
+    Import every legacy snapshot source, dated by dates (source -> YYYY-MM-DD) or by
+    their last commit. Returns the ids of the new runs.
+    """
+    dates = dates or {}
+    run_ids = [import_snapshot(store, source, dates.get(source)) for source in sources if os.path.exists(source)]
+    return [run_id for run_id in run_ids if run_id is not None]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Import and query the tariff price history.')
+    parser.add_argument('--history', default=HISTORY_FILE, help=f'History database (default: {HISTORY_FILE})')
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_parser = commands.add_parser('import', help='Record the legacy snapshots as runs')
+    import_parser.add_argument('sources', nargs='*', default=LEGACY_SNAPSHOTS, metavar='SOURCE[=YYYY-MM-DD]',
+                               help='Snapshot folders or files, each with its tariff date (default: the known '
+                                    'legacy snapshots); sources without a date use their last git commit')
+    commands.add_parser('runs', help='List the recorded runs')
+    series_parser = commands.add_parser('series', help="Print a provider's prices over time")
+    series_parser.add_argument('--provider', required=True, help='Provider key from PROVIDERS')
+    series_parser.add_argument('--port', help='Port code')
+    series_parser.add_argument('--from', dest='start', help='First tariff date (YYYY-MM-DD)')
+    series_parser.add_argument('--to', dest='end', help='Last tariff date (YYYY-MM-DD)')
+    args = parser.parse_args()
+
+    store = PriceHistory(args.history)
+    if args.command == 'import':
+        try:
+            dates = dict(parse_source(source) for source in args.sources)
+            run_ids = import_legacy(store, list(dates), dates)
+        except ValueError as error:
+            store.close()
+            parser.error(str(error))
+        if run_ids:
+            write_trends(store, store.run_months(run_ids))
+        print(f"Imported {len(run_ids)} snapshot runs into '{args.history}'")
+    elif args.command == 'runs':
+        print(store.runs().to_string(index=False))
+    else:
+        series = store.prices(args.provider, args.port, args.start, args.end)
+        print(series.drop(columns=['month']).to_string(index=False))
+    store.close()
@@ -0,0 +1,5 @@
+import os
+import sys
+
+# comparacion.py lives at the repository root, next to this folder
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
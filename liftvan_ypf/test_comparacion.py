@@ -1,3 +1,21 @@
+import json
+import os
+import random
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import comparacion
+from comparacion import (PROVIDERS, DestinationMatcher, MatchCache, OutputWriter, add_price_spreads,
+                         build_match_context, build_price_indexes, build_price_table, carry_over_groups,
+                         clean_provider, compute_row_hashes, extract_city_name, extract_port_code,
+                         find_best_match, find_changed_destinations, get_providers, ingest_provider,
+                         ingest_providers, iter_provider_chunks, load_provider, match_destinations,
+                         normalize_destinations, read_artifact, run_streaming, write_artifact, write_report)
+from rendimiento import synthetic_ports
+
 def compare_companies(data):
     filtered_data = [d for d in data if d is not None and d != 0]
     if not filtered_data:
@@ -10,4 +28,338 @@ def test_compare_companies():
     assert compare_companies([None, 0, 1]) == 1
     assert compare_companies([None, None, 0]) == None
     assert compare_companies([float('nan'), 1, 2]) == 2
-    assert compare_companies([float('nan'), float('nan'), 0]) == None
\ No newline at end of file
+    assert compare_companies([float('nan'), float('nan'), 0]) == None
+
+def test_destination_matcher_matches_find_best_match():
+    rng = random.Random(7)
+    cities = ['abu dhabi', 'alexandria', 'algeciras', 'karachi', 'klang', 'haifa',
+              'ashdod', 'seattle', 'seatlle', 'dublin', 'lyttelton', 'port klang']
+    def noisy(city):
+        chars = list(city)
+        for _ in range(rng.randint(0, 2)):
+            chars[rng.randrange(len(chars))] = rng.choice('abcdefghijklmnopqrstuvwxyz ')
+        return ''.join(chars).title()
+    destinations = [f"{noisy(c)} ({rng.choice(['AEAUH', 'EGALY', 'PKKHI'])})" for c in cities * 8]
+    destinations += ['*Nota', None, float('nan'), 'Regina', 'Karachi - PKKHI']
+    matcher = DestinationMatcher(destinations)
+    queries = [noisy(c) for c in cities * 5] + ['', 'X', 'Rotterdam', 'Karachi / Qasim']
+    for query in queries:
+        assert matcher.match(query) == find_best_match(query, destinations)
+
+def test_destination_matcher_scans_about_as_many_names_as_the_list_grows():
+    rng = random.Random(5)
+    names, codes = synthetic_ports(4000, np.random.default_rng(0))
+    destinations = [f'{city} ({code})' for city, code in zip(names, codes)]
+    queries = []
+    for city in rng.sample(list(names[:500]), 100):
+        chars = list(city.lower())
+        chars[rng.randrange(len(chars))] = rng.choice('aeiou')
+        queries.append(''.join(chars))
+
+    per_query = {}
+    for size in [500, 4000]:
+        matcher = DestinationMatcher(destinations[:size])
+        matches = [matcher.match_city(query) for query in queries]
+        per_query[size] = matcher.scanned / len(queries)
+        if size == 500:
+            assert matches == [find_best_match(query, destinations[:size]) for query in queries]
+    # Eight times the names, about as many names looked at per query
+    assert per_query[4000] < 2 * per_query[500] + 1
+    assert per_query[4000] < 5
+
+def test_normalize_destinations_vectorized_matches_scalar():
+    destinations = pd.Series([
+        'Alexandria (EGALY)', 'Abu Dhabi - AEAUH', 'Port Klang MYPKG', 'Le Havre FRLEH / Rouen',
+        'Regina', '  Karachi   (PKKHI) ', 'Sao Paulo - Santos (BRSSZ)', 'Seattle, WA USSEA x',
+        '*Nota', 'HAPAG: via Algeciras', 'San\xa0Antonio (CLSAI)', 'Santo\u2003Tomas\u2028de Castilla',
+        'Puerto\xa0Cabello\xa0VEPBL', '', None,
+    ])
+    vectorized = normalize_destinations(pd.DataFrame({'destino': destinations}))
+    assert vectorized['port_code'].tolist() == [extract_port_code(d) for d in destinations]
+    assert vectorized['city_name'].tolist() == [extract_city_name(d) for d in destinations]
+
+def test_add_price_spreads():
+    df = pd.DataFrame({
+        'aires_20': [100.0, np.nan, 0.0, 150.0], 'fcl_20': [80.0, 200.0, 90.0, 150.0],
+        'silver_20': [np.nan, np.nan, 120.0, 200.0],
+        'aires_40': [np.nan] * 4, 'fcl_40': [1.0] * 4, 'silver_40': [2.0] * 4,
+    })
+    result = add_price_spreads(df, {'aires': 'AiresDS', 'fcl': 'EXIM', 'silver': 'Silver'})
+    assert result['best_price_20'].tolist()[0] == 80.0
+    assert result['worst_price_20'].tolist()[0] == 100.0
+    assert result['price_diff_20_pct'].tolist()[0] == 25.0
+    # A single positive price is not a comparison, zeros do not count
+    assert np.isnan(result['best_price_20'].iloc[1])
+    assert pd.isna(result['best_provider_20'].iloc[1])
+    assert result['best_price_20'].iloc[2] == 90.0
+    # Ties go to the first provider
+    assert result['best_provider_20'].iloc[0] == 'EXIM'
+    assert result['best_provider_20'].iloc[2] == 'EXIM'
+    assert result['best_provider_20'].iloc[3] == 'AiresDS'
+    assert result['best_provider_40'].tolist() == ['EXIM'] * 4
+    assert result['price_diff_40'].tolist() == [1.0] * 4
+
+def test_clean_provider_applies_registry_rules():
+    aires = get_providers(['aires'])[0]
+    raw = pd.DataFrame({
+        'destino': ['Alexandria (EGALY)', '*Milan (ITMIL)', 'HAPAG: via Algeciras', 'Regina', 'Bogota (COBOG)'],
+        'veinte': ['$2,319.00', '$1.00', '$1.00', '$4,115.00', None],
+        'curenta': ['$2,707.00', '$1.00', '$1.00', '$3,864.00', '$5.00'],
+    })
+    cleaned = clean_provider(raw, aires)
+    assert cleaned['destino'].tolist() == ['Alexandria (EGALY)', 'Regina']
+    assert cleaned['veinte'].tolist() == [2319.0, 4115.0]
+    assert cleaned['cuarenta'].tolist() == [2707.0, 3864.0]
+    assert cleaned['port_code'].tolist() == ['EGALY', '']
+    assert set(cleaned['source']) == {'AiresDS'}
+
+def test_ingest_provider_reuses_the_cache_until_contents_or_rules_change(tmp_path):
+    cache_dir = str(tmp_path / 'cache')
+    path = tmp_path / 'fcl.xlsx'
+    pd.DataFrame({'destino': ['Santos', 'Haifa (ILHFA)'], 'veinte': [800, 900],
+                  'cuarenta': [1000, 1100]}).to_excel(path, index=False)
+    provider = dict(get_providers(['fcl'])[0], file=str(path))
+
+    df, report = ingest_provider(provider, cache_dir)
+    assert report['source'] == 'workbook'
+    cached, report = ingest_provider(provider, cache_dir)
+    assert report['source'] == 'cache'
+    pd.testing.assert_frame_equal(cached, df)
+
+    # Touching the workbook only refreshes the metadata
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 5_000_000_000))
+    assert ingest_provider(provider, cache_dir)[1]['source'] == 'cache'
+    with open(os.path.join(cache_dir, 'fcl.json')) as f:
+        assert json.load(f)['mtime'] == os.stat(path).st_mtime
+
+    pd.DataFrame({'destino': ['Santos'], 'veinte': [850], 'cuarenta': [1000]}).to_excel(path, index=False)
+    df, report = ingest_provider(provider, cache_dir)
+    assert report['source'] == 'workbook' and df['veinte'].tolist() == [850.0]
+    assert ingest_provider(provider, cache_dir)[1]['source'] == 'cache'
+
+    # A different cleaning rule in the registry parses the workbook again
+    assert ingest_provider(dict(provider, fillna_zero=False), cache_dir)[1]['source'] == 'workbook'
+
+def test_ingest_providers_only_sends_uncached_workbooks_to_the_pool(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    providers = []
+    for key in ['fcl', 'silver']:
+        pd.DataFrame({'destino': ['Santos'], 'veinte': [800], 'cuarenta': [1000]}).to_excel(f'{key}.xlsx', index=False)
+        providers.append(dict(get_providers([key])[0], file=f'{key}.xlsx'))
+    frames, _ = ingest_providers(providers, workers=1)
+
+    class NoPool:
+        def __init__(self, *args, **kwargs):
+            raise AssertionError('no workbook needed parsing')
+    monkeypatch.setattr(comparacion, 'ProcessPoolExecutor', NoPool)
+    cached, reports = ingest_providers(providers, workers=2)
+    assert [report['source'] for report in reports] == ['cache', 'cache']
+    pd.testing.assert_frame_equal(cached['silver'], frames['silver'])
+
+    # A single changed workbook is parsed in this process, the other one still comes from the cache
+    pd.DataFrame({'destino': ['Santos'], 'veinte': [850], 'cuarenta': [1000]}).to_excel('silver.xlsx', index=False)
+    frames, reports = ingest_providers(providers, workers=2)
+    assert [report['source'] for report in reports] == ['cache', 'workbook']
+    assert frames['silver']['veinte'].tolist() == [850.0]
+    assert ingest_providers(providers, workers=2)[1][1]['source'] == 'cache'
+
+def test_price_indexes_keep_first_row_per_destination():
+    frames = {
+        'fcl': pd.DataFrame({'destino': ['Haifa (ILHFA)', 'Haifa (ILHFA)'], 'port_code': ['ILHFA'] * 2,
+                             'veinte': [1.0, 2.0], 'cuarenta': [3.0, 4.0]}),
+        'silver': pd.DataFrame({'destino': ['Haifa (ILHFA)'], 'port_code': ['ILHFA'],
+                                'veinte': [np.nan], 'cuarenta': [5.0]}),
+    }
+    indexes = build_price_indexes(build_price_table(frames))
+    assert indexes['fcl'] == {'Haifa (ILHFA)': (1.0, 3.0)}
+    assert np.isnan(indexes['silver']['Haifa (ILHFA)'][0])
+
+def _frames(silver_rows):
+    frames = {
+        'fcl': pd.DataFrame({'destino': ['Haifa (ILHFA)', 'Dublin (IEDUB)', 'Klang - MYPKG'],
+                             'veinte': [1.0, 2.0, 3.0], 'cuarenta': [1.0, 2.0, 3.0]}),
+        'silver': pd.DataFrame(silver_rows, columns=['destino', 'veinte', 'cuarenta']),
+    }
+    return {key: normalize_destinations(df) for key, df in frames.items()}
+
+def test_incremental_run_only_recomputes_touched_groups():
+    labels = {'fcl': 'EXIM', 'silver': 'Silver'}
+    old = _frames([('Haifa - ILHFA', 5.0, 5.0), ('Dublin (IEDUB)', 6.0, 6.0)])
+    old_comparison, old_no_matches, _ = match_destinations(sorted(['Haifa (ILHFA)', 'Dublin (IEDUB)', 'Klang - MYPKG', 'Haifa - ILHFA']),
+                                                           build_match_context(old), labels)
+
+    # Dublin changes price and Klang appears in Silver; Haifa is untouched
+    new = _frames([('Haifa - ILHFA', 5.0, 5.0), ('Dublin (IEDUB)', 7.0, 7.0), ('Klang (MYPKG)', 8.0, 8.0)])
+    context = build_match_context(new)
+    changed = find_changed_destinations(compute_row_hashes(old), compute_row_hashes(new))
+    assert changed['silver'] == {'added': {'Klang (MYPKG)'}, 'removed': set(), 'modified': {'Dublin (IEDUB)'}}
+
+    kept = carry_over_groups(old_comparison + old_no_matches, changed, context)
+    assert [destino for destino, _, _ in kept] == ['Haifa (ILHFA)']
+
+    matched = set().union(*(members for _, members, _ in kept))
+    destinations = sorted(set(new['fcl']['destino']) | set(new['silver']['destino']))
+    comparison, no_matches, _ = match_destinations(destinations, context, labels, matched)
+    full_comparison, full_no_matches, _ = match_destinations(destinations, context, labels)
+    incremental_rows = sorted((row for _, _, row in kept + comparison), key=lambda row: row['destino'])
+    assert incremental_rows == sorted((row for _, _, row in full_comparison), key=lambda row: row['destino'])
+    assert no_matches == full_no_matches == []
+
+def test_port_code_join_uses_the_first_destination_per_code():
+    labels = {'fcl': 'EXIM', 'silver': 'Silver'}
+    frames = {
+        'fcl': pd.DataFrame({'destino': ['Jebel Ali - AEJEA', 'Jebel Ali Port (AEJEA)', 'Seattle'],
+                             'veinte': [1.0, 2.0, 3.0], 'cuarenta': [1.0, 2.0, 3.0]}),
+        'silver': pd.DataFrame({'destino': ['Dubai Jebel Ali (AEJEA)', 'Seatle', 'Regina'],
+                                'veinte': [4.0, 5.0, 6.0], 'cuarenta': [4.0, 5.0, 6.0]}),
+    }
+    frames = {key: normalize_destinations(df) for key, df in frames.items()}
+    context = build_match_context(frames, join='port_code')
+    assert context['code_indexes']['fcl'] == {'AEJEA': 'Jebel Ali - AEJEA'}
+
+    destinations = sorted(set(frames['fcl']['destino']) | set(frames['silver']['destino']))
+    comparison, no_matches, stage_counts = match_destinations(destinations, context, labels)
+    rows = {destino: row for destino, _, row in comparison}
+    assert rows['Dubai Jebel Ali (AEJEA)']['fcl_original'] == 'Jebel Ali - AEJEA'
+    assert rows['Jebel Ali Port (AEJEA)']['silver_original'] == 'Dubai Jebel Ali (AEJEA)'
+    # Destinations without a code still go through the fuzzy matcher
+    assert rows['Seatle']['fcl_original'] == 'Seattle'
+    assert [destino for destino, _, _ in no_matches] == ['Regina']
+    assert [no_matches[0][2][column] for column in ['veinte', 'cuarenta', 'reason']] == \
+        [6.0, 6.0, 'Only available in one source']
+    assert stage_counts == {'exact': 4, 'port_code': 2, 'fuzzy': 1, 'unmatched': 1}
+
+def test_match_cache_is_invalidated_by_threshold_and_candidates(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    destinations = ['Abu Dhabi - AEAUH', 'Alexandria (EGALY)']
+
+    cache = MatchCache(path, threshold=0.8)
+    matcher = DestinationMatcher(destinations, 0.8, cache=cache, provider='aires')
+    assert matcher.match('Abu Dhabi - AEABD') == 'Abu Dhabi - AEAUH'
+    assert matcher.match('Rotterdam') is None
+    # Names scored in this run are not hits when looked up again
+    assert matcher.match('Abu Dhabi (AEAUH)') == 'Abu Dhabi - AEAUH'
+    assert (cache.hits, cache.misses) == (0, 2)
+    # Results for one threshold are never served to another
+    with pytest.raises(ValueError):
+        DestinationMatcher(destinations, 0.6, cache=cache, provider='aires')
+    cache.close()
+
+    cache = MatchCache(path, threshold=0.8)
+    assert cache.entries('aires')['abu dhabi'] == ('Abu Dhabi - AEAUH', 1.0)
+    matcher = DestinationMatcher(destinations, 0.8, cache=cache, provider='aires')
+    assert matcher.match('Rotterdam') is None and matcher.match('Rotterdam') is None
+    assert (cache.hits, cache.misses) == (1, 0)
+    # A new candidate list drops the provider's entries
+    cache.use_candidates('aires', [('rotterdam', 'Rotterdam (NLRTM)')])
+    assert cache.entries('aires') == {}
+    cache.close()
+
+    assert MatchCache(path, threshold=0.9).entries('aires') == {}
+
+def test_artifact_round_trip_uses_compact_types(tmp_path):
+    df = pd.DataFrame({
+        'destino': ['Klang (MYPKG)', 'Santos'],
+        'port_code': ['MYPKG', ''],
+        'aires_20': [1200.0, np.nan],
+        'best_provider_20': ['AiresDS', np.nan],
+        'sources_available': [2, 3],
+    })
+    path = write_artifact(df, 'data/price_comparison.csv', artifact_dir=str(tmp_path))
+    assert path == str(tmp_path / 'price_comparison.arrow')
+
+    loaded = read_artifact(path)
+    assert isinstance(loaded['port_code'].dtype, pd.CategoricalDtype)
+    assert isinstance(loaded['best_provider_20'].dtype, pd.CategoricalDtype)
+    assert loaded['aires_20'].dtype == np.float32
+    assert loaded['sources_available'].dtype == np.int64
+    pd.testing.assert_frame_equal(loaded.astype(df.dtypes.to_dict()), df, check_dtype=False)
+
+def test_streamed_chunks_match_the_workbook_reader(tmp_path):
+    path = str(tmp_path / 'aires.xlsx')
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['destino', 'veinte', 'curenta'])
+    for row in [['Klang (MYPKG)', '$1,200', 1500], ['*Portland', 900, 950], ['HAPAG: Santos', 1, 2],
+                ['Santos - BRSSZ', 800, '#VALUE!'], [None, None, None], ['Rabat', 700, 750]]:
+        sheet.append(row)
+    workbook.save(path)
+    provider = dict(PROVIDERS[0], file=path)
+
+    chunks = list(iter_provider_chunks(provider, chunk_rows=2))
+    assert len(chunks) == 3
+    streamed = pd.concat(chunks, ignore_index=True)
+    pd.testing.assert_frame_equal(streamed, load_provider(provider), check_dtype=False)
+
+    # EXIM keeps rows without prices, so blank rows inside the sheet stay as well
+    path = str(tmp_path / 'fcl.xlsx')
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.append(['destino', 'veinte', 'cuarenta'])
+    for row in [['Santos - BRSSZ', 800, 900], [None, None, None], ['Rabat', None, 750], [None, None, None]]:
+        sheet.append(row)
+    sheet.cell(row=7, column=1).number_format = '0.00'  # formatted, but empty, trailing row
+    workbook.save(path)
+    provider = dict(next(p for p in PROVIDERS if p['key'] == 'fcl'), file=path)
+
+    streamed = pd.concat(iter_provider_chunks(provider, chunk_rows=2), ignore_index=True)
+    assert len(streamed) == 3
+    pd.testing.assert_frame_equal(streamed, load_provider(provider), check_dtype=False)
+
+def test_streaming_run_reports_empty_outputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    providers = []
+    for key in ['fcl', 'silver']:
+        pd.DataFrame({'destino': ['Santos - BRSSZ', 'Haifa (ILHFA)'], 'veinte': [800, 900],
+                      'cuarenta': [1000, 1100]}).to_excel(f'{key}.xlsx', index=False)
+        providers.append(dict(get_providers([key])[0], file=f'{key}.xlsx'))
+
+    # Every destination is in both tariffs: nothing goes to no_matches
+    summary, _ = run_streaming(providers, chunk_rows=1)
+    assert summary['total_destinations_compared'] == 2
+    report = pd.read_excel('price_comparison_report.xlsx', sheet_name=None)
+    assert len(report['Price Comparison']) == 2 and report['No Matches'].empty
+
+    # A single provider compares nothing
+    summary, _ = run_streaming(providers[:1], chunk_rows=1)
+    assert summary == {}
+    report = pd.read_excel('price_comparison_report.xlsx', sheet_name=None)
+    assert report['Price Comparison'].empty and len(report['No Matches']) == 2
+
+def test_output_writer_appends_batches_to_csv_and_artifact(tmp_path):
+    csv_path = str(tmp_path / 'no_matches.csv')
+    writer = OutputWriter(csv_path, artifact_dir=str(tmp_path / 'arrow'))
+    writer.append(pd.DataFrame({'destino': ['Santos'], 'original_destino': [None], 'veinte': [800.0]}))
+    writer.append(pd.DataFrame({'destino': ['Rabat'], 'original_destino': ['Rabat'], 'veinte': [np.nan]}))
+    assert not os.path.exists(csv_path)  # only moved into place on close
+    writer.close()
+
+    expected = pd.DataFrame({'destino': ['Santos', 'Rabat'], 'original_destino': [None, 'Rabat'], 'veinte': [800.0, np.nan]})
+    assert open(csv_path).read() == expected.to_csv(index=False)
+    artifact = read_artifact(writer.artifact_path)
+    assert artifact['veinte'].dtype == np.float32
+    assert artifact['original_destino'].isna().tolist() == [True, False]
+
+def test_write_report_matches_to_excel(tmp_path):
+    comparison = pd.DataFrame({'destino': ['Santos', 'Rabat'], 'price_diff_20_pct': [np.inf, 12.5],
+                               'best_provider_20': ['EXIM', None]})
+    summary = pd.DataFrame({'Value': [2.0, 12.5]}, index=['total_destinations_compared', 'avg_price_diff_20_pct'])
+    expected_path = str(tmp_path / 'expected.xlsx')
+    with pd.ExcelWriter(expected_path, engine='openpyxl') as writer:
+        comparison.to_excel(writer, sheet_name='Price Comparison', index=False)
+        summary.to_excel(writer, sheet_name='Summary Statistics')
+        comparison.to_excel(writer, sheet_name='Source', index=False)
+
+    path = str(tmp_path / 'report.xlsx')
+    # Lazy sheets are read in chunks only when written
+    chunks = lambda: (comparison.iloc[i:i + 1] for i in range(len(comparison)))
+    write_report(path, {'Price Comparison': (comparison, False), 'Summary Statistics': (summary, True),
+                        'Source': (chunks, False)}, chunk_rows=1)
+
+    expected = pd.read_excel(expected_path, sheet_name=None)
+    written = pd.read_excel(path, sheet_name=None)
+    assert list(written) == list(expected)
+    for name in expected:
+        pd.testing.assert_frame_equal(written[name], expected[name])
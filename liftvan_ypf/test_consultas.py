@@ -0,0 +1,64 @@
+import io
+import os
+import numpy as np
+import pandas as pd
+import consultas
+from comparacion import write_artifact
+
+def make_data(version):
+    no_matches = pd.DataFrame({
+        'destino': ['Santos', 'Navegantes (BRNVT)', 'Leixões'],
+        'original_destino': ['Santos', 'Navegantes (BRNVT)', 'Leixões'],
+        'port_code': ['', 'BRNVT', ''],
+        'source': pd.Categorical(['EXIM', 'EXIM', 'Silver'], categories=['AiresDS', 'EXIM', 'Silver']),
+        'veinte': [1070.0, np.nan, 900.0],
+        'cuarenta': [1230.0, 1300.0, np.nan],
+        'reason': 'Only available in one source',
+    })
+    return {'version': version, 'no_matches': no_matches}
+
+def test_no_match_view_is_shared_per_version():
+    data = make_data('v1')
+    view = consultas.no_match_view(data, None, 'EXIM')
+    assert consultas.no_match_view(make_data('v1'), None, 'EXIM') is view
+    # Unused categories are left out of the distribution
+    assert view['source_dist'].to_dict() == {'EXIM': 2}
+    assert view['detail']['Precio 20\''].tolist() == [1070.0, 'N/A']
+
+    assert consultas.no_match_view(data, 'BRNVT', None)['detail']['Destino'].tolist() == ['Navegantes (BRNVT)']
+    assert consultas.no_match_options(data) == {'ports': ['BRNVT'], 'sources': ['EXIM', 'Silver']}
+
+    # A new data version replaces the cached results
+    assert consultas.no_match_view(make_data('v2'), None, 'EXIM') is not view
+
+def test_export_writes_every_format_in_chunks(monkeypatch):
+    monkeypatch.setattr(consultas, 'EXPORT_CHUNK_ROWS', 2)
+    data = make_data('export')
+    df = data['no_matches']
+
+    csv = consultas.export(data, 'no_matches', 'csv')
+    assert csv.decode('utf-8') == df.to_csv(index=False)
+    parquet = pd.read_parquet(io.BytesIO(consultas.export(data, 'no_matches', 'parquet')))
+    pd.testing.assert_frame_equal(parquet, df)
+    excel = pd.read_excel(io.BytesIO(consultas.export(data, 'no_matches', 'xlsx')))
+    assert excel['destino'].tolist() == df['destino'].tolist()
+
+    # Filtered views are exported as shown
+    filtered = consultas.export(data, 'no_matches', 'csv', None, 'Silver').decode('utf-8')
+    assert filtered.splitlines()[1:] == ['Leixões,Leixões,,Silver,900.0,,Only available in one source']
+
+def test_read_dataset_skips_an_artifact_older_than_its_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs('data')
+    df = pd.DataFrame({'destino': ['Santos', 'Haifa'], 'veinte': [1070.0, 900.0]})
+    df.to_csv('data/prices.csv', index=False)
+    write_artifact(df, 'data/prices.csv')
+    read, _ = consultas.read_dataset('data/prices.csv')
+    assert read['veinte'].dtype == np.float32
+
+    # The CSV is rewritten after the artifact: its contents win
+    df.assign(veinte=[1100.0, 950.0]).to_csv('data/prices.csv', index=False)
+    stat = os.stat('data/arrow/prices.arrow')
+    os.utime('data/prices.csv', ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    read, _ = consultas.read_dataset('data/prices.csv')
+    assert read['veinte'].tolist() == [1100.0, 950.0]
@@ -0,0 +1,34 @@
+import numpy as np
+import pandas as pd
+from diferencias import diff_versions, diff_summary
+
+def test_diff_pairs_destinations_and_computes_deltas():
+    old = pd.DataFrame({
+        'destino': ['Inchon - KRINC', 'Busan (KRPUS)', 'Santos', 'Alger (DZALG)'],
+        'veinte': [1000.0, 2000.0, 900.0, 0.0],
+        'cuarenta': [1500.0, 2500.0, 1100.0, 3450.0],
+        'port_code': ['KRINC', 'KRPUS', '', 'DZALG'],
+    })
+    new = pd.DataFrame({
+        'destino': ['Busan - KRPUS', 'Incheon (KRINC)', 'Santos', 'Santos', 'Alger (DZALG)'],
+        'veinte': [2000.0, 1100.0, 900.0, 950.0, 2950.0],
+        'cuarenta': [2500.0, 1200.0, 1100.0, 1150.0, 3450.0],
+        'port_code': ['KRPUS', 'KRINC', '', '', 'DZALG'],
+    })
+
+    diff = diff_versions(old, new, on='port_code').set_index('destino_new')
+    assert diff.loc['Incheon (KRINC)', 'destino_old'] == 'Inchon - KRINC'
+    assert diff.loc['Incheon (KRINC)', 'veinte_delta'] == 100.0
+    assert diff.loc['Incheon (KRINC)', 'cuarenta_delta_pct'] == -20.0
+    assert diff.loc['Incheon (KRINC)', 'largest_change_pct'] == 20.0
+    # A price that appears counts as a change without a delta
+    assert diff.loc['Alger (DZALG)', 'status'] == 'changed'
+    assert np.isnan(diff.loc['Alger (DZALG)', 'veinte_delta'])
+    assert diff.loc['Busan - KRPUS', 'status'] == 'unchanged'
+    # Duplicated destinations pair in file order
+    assert diff.loc['Santos', 'status'].tolist() == ['added', 'unchanged']
+
+    # Without port codes the renamed port is a removal plus an addition
+    summary = diff_summary(diff_versions(old, new))
+    assert {k: summary[f'{k}_destinations'] for k in ['changed', 'added', 'removed', 'unchanged']} == \
+        {'changed': 1, 'added': 2, 'removed': 1, 'unchanged': 2}
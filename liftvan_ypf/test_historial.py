@@ -0,0 +1,68 @@
+import subprocess
+import pandas as pd
+import pytest
+from comparacion import PriceHistory
+from historial import import_snapshot, legacy_provider, parse_source
+
+def test_snapshot_import_skips_stored_tariffs(tmp_path):
+    outputs = tmp_path / 'versiones_viejas'
+    outputs.mkdir()
+    # Exported with the old rules, which left missing EXIM prices empty instead of 0
+    pd.DataFrame({'destino': ['Jebel Ali - AEJEA', 'Santos'], 'veinte': [2600.0, None],
+                  'cuarenta': [2350.0, 1230.0]}).to_csv(outputs / 'fcl_data.csv', index=False)
+    workbook = tmp_path / 'fclviejo.xlsx'
+    pd.DataFrame({'destino': ['Jebel Ali - AEJEA', 'Santos'], 'veinte': [2600, 0],
+                  'cuarenta': [2350, 1230]}).to_excel(workbook, index=False)
+    assert legacy_provider(str(workbook))['key'] == legacy_provider(str(outputs / 'exim_data.csv'))['key'] == 'fcl'
+
+    store = PriceHistory(str(tmp_path / 'history.sqlite'))
+    run_id = import_snapshot(store, str(outputs), '2025-06-01')
+    # Same tariff once cleaned with the current rules, and the folder was already imported
+    assert import_snapshot(store, str(workbook), '2025-06-01') is None
+    assert import_snapshot(store, str(outputs)) is None
+
+    series = store.prices('fcl', 'AEJEA')
+    assert series[['run_id', 'date', 'month', 'veinte']].values.tolist() == [[run_id, '2025-06-01', '2025-06', 2600.0]]
+    assert store.prices('fcl', end='2025-05-31').empty
+    assert store.runs()['rows'].tolist() == [2]
+    store.close()
+
+def test_rollups_summarize_each_month_per_port(tmp_path):
+    store = PriceHistory(str(tmp_path / 'history.sqlite'))
+    for date, prices in [('2025-06-02', [1000.0, 0.0]), ('2025-06-23', [1200.0, 1500.0]), ('2025-07-07', [1100.0, 1400.0])]:
+        run_id = store.start_run(date)
+        store.add_prices(run_id, 'fcl', pd.DataFrame({
+            'destino': ['Jebel Ali - AEJEA', 'Santos'], 'port_code': ['AEJEA', ''],
+            'veinte': prices, 'cuarenta': prices}))
+    store.refresh_rollups(['2025-06'])
+    store.refresh_rollups(['2025-06', '2025-07'])
+
+    rollups = store.rollups().set_index(['port', 'month', 'size'])
+    assert rollups.loc[('AEJEA', '2025-06', '20'), ['min_price', 'avg_price', 'max_price', 'runs']].tolist() == \
+        [1000.0, 1100.0, 1200.0, 2]
+    # Lines without a port code go under their destination; zero prices do not count
+    assert rollups.loc[('Santos', '2025-06', '40'), ['min_price', 'tariff_lines']].tolist() == [1500.0, 1]
+    assert len(rollups) == 8
+    store.close()
+
+def test_snapshots_are_dated_by_their_last_commit_or_not_at_all(tmp_path, monkeypatch):
+    snapshot = tmp_path / 'fclviejo.xlsx'
+    pd.DataFrame({'destino': ['Santos'], 'veinte': [1070], 'cuarenta': [1230]}).to_excel(snapshot, index=False)
+    assert parse_source(f'{snapshot}=2025-06-01') == (str(snapshot), '2025-06-01')
+    assert parse_source(str(snapshot)) == (str(snapshot), None)
+    with pytest.raises(ValueError):
+        parse_source(f'{snapshot}=junio')
+
+    store = PriceHistory(str(tmp_path / 'history.sqlite'))
+    # Not committed anywhere: the mtime is only the checkout time, so there is no date to use
+    with pytest.raises(ValueError, match='YYYY-MM-DD'):
+        import_snapshot(store, str(snapshot))
+
+    for name, value in [('NAME', 'test'), ('EMAIL', 'test@example.com'), ('DATE', '2025-03-04T10:00:00')]:
+        monkeypatch.setenv(f'GIT_AUTHOR_{name}', value)
+        monkeypatch.setenv(f'GIT_COMMITTER_{name}', value)
+    for command in [['init', '-q'], ['add', snapshot.name], ['commit', '-q', '-m', 'Snapshot']]:
+        subprocess.run(['git', *command], cwd=tmp_path, check=True)
+    run_id = import_snapshot(store, str(snapshot))
+    assert store.runs().set_index('run_id').loc[run_id, 'date'] == '2025-03-04'
+    store.close()
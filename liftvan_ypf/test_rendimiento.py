@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+import pytest
+from comparacion import PROVIDERS, clean_provider
+from rendimiento import (STAGES, synthetic_ports, synthetic_tariff, write_synthetic_workbooks, run_stages,
+                         save_results, compare_results)
+
+def test_synthetic_tariffs_go_through_the_cleaning_rules():
+    rng = np.random.default_rng(3)
+    ports = synthetic_ports(200, rng)
+    by_key = {p['key']: p for p in PROVIDERS}
+
+    aires = synthetic_tariff('aires', 2000, ports, rng)
+    assert aires['destino'].str.startswith('*').any() and aires['destino'].str.contains('HAPAG:').any()
+    assert aires['veinte'].astype(str).str.startswith('$').any()
+    cleaned = clean_provider(aires, by_key['aires'])
+    assert not cleaned['destino'].str.startswith('*').any()
+    assert not cleaned['destino'].str.contains('HAPAG:').any()
+    assert cleaned['veinte'].dtype == float and cleaned['veinte'].notna().all()
+
+    silver = clean_provider(synthetic_tariff('silver', 2000, ports, rng), by_key['silver'])
+    # Every format yields the port's city name, except the misspelled ones; bare names have no code
+    assert silver['city_name'].isin({city.lower() for city in ports[0]}).mean() > 0.9
+    assert silver['port_code'].isin(set(ports[1]) | {''}).all()
+    assert 0.5 < (silver['port_code'] != '').mean() < 0.8
+    assert (silver['veinte'] == 0).any()
+
+def test_benchmark_times_every_stage_and_compares_commits(tmp_path, monkeypatch):
+    providers = write_synthetic_workbooks(60, str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    timings, compared = run_stages(providers)
+    assert list(timings) == STAGES
+    assert compared > 0
+    assert (tmp_path / 'price_comparison_report.xlsx').exists()
+
+    results = pd.DataFrame([{'commit': commit, 'rows': 60, 'stage': stage, 'seconds': seconds}
+                            for commit, factor in [('aaa1111', 1.0), ('bbb2222', 2.0)]
+                            for stage, seconds in timings.items()
+                            for seconds in [seconds * factor + 1]])
+    save_results(results, 'data/benchmark_results.csv')
+    table = compare_results('data/benchmark_results.csv')
+    assert list(table.columns) == ['aaa1111', 'bbb2222', 'change_pct']
+    assert table.loc[(60, 'match'), 'bbb2222'] == pytest.approx(timings['match'] * 2 + 1)
+
+def test_benchmark_runs_the_stages_of_main_with_the_caches(tmp_path, monkeypatch):
+    providers = write_synthetic_workbooks(60, str(tmp_path))
+    monkeypatch.chdir(tmp_path)
+    _, compared = run_stages(providers, caches=True)
+    timings, cached = run_stages(providers, caches=True)
+    assert cached == compared
+    # The second run reads the cleaned frames back instead of cleaning them again
+    assert timings['clean'] == 0 and timings['normalize'] == 0
+    assert (tmp_path / 'data' / 'cache').is_dir() and (tmp_path / 'data' / 'match_cache.sqlite').exists()
+    assert (tmp_path / 'data' / 'price_table.csv').exists() and (tmp_path / 'data' / 'history.sqlite').exists()
+
+    save_results(pd.DataFrame([{'commit': 'aaa1111', 'rows': 60, 'stage': stage, 'seconds': seconds,
+                                'caches': True} for stage, seconds in timings.items()]),
+                 'data/benchmark_results.csv')
+    assert compare_results('data/benchmark_results.csv').empty
+    assert compare_results('data/benchmark_results.csv', caches=True).loc[(60, 'clean'), 'aaa1111'] == 0
@@ -0,0 +1,252 @@
+"""
+Benchmarks of the comparison pipeline on synthetic AiresDS, EXIM and Silver tariffs.
+
+Each size generates one workbook per provider in that provider's layout, with the
+destination formats extract_port_code handles ("City (CODE)", "City - CODE", bare
+names) and the noise the cleaning rules drop ('*' notes, 'HAPAG:' lines, missing
+prices, '$1,234' and '-' prices). The stage functions of comparacion.main run in
+order and each one is timed:
+
+    ingest     read the workbooks (or the ingest cache)
+    clean      provider cleaning rules
+    normalize  port codes and city names
+    match      match context, destination matching and incremental state
+    aggregate  comparison frame, spreads, sorting and summary statistics
+    write      Excel report, CSVs, Arrow artifacts and price history
+
+Results are appended to data/benchmark_results.csv with the current commit, so
+runs on different commits can be compared:
+
+    python rendimiento.py --sizes 100,1000,10000,100000
+    python rendimiento.py --compare
+
+--caches runs with the ingest and match caches on, as main does by default; those
+results are stored and compared apart from the uncached ones.
+"""
+import os
+import time
+import platform
+import tempfile
+import subprocess
+from contextlib import contextmanager, redirect_stdout
+import numpy as np
+import pandas as pd
+from comparacion import (PROVIDERS, MATCH_CACHE_FILE, MATCH_THRESHOLD, MatchCache, provider_labels,
+                         ingest_providers, match_providers, aggregate_results, write_outputs, record_history)
+
+# Rows per provider workbook benchmarked by default
+BENCHMARK_SIZES = [100, 1_000, 10_000, 100_000]
+BENCHMARK_PROVIDERS = ['aires', 'fcl', 'silver']
+BENCHMARK_RESULTS = 'data/benchmark_results.csv'
+STAGES = ['ingest', 'clean', 'normalize', 'match', 'aggregate', 'write']
+
+# Distinct ports drawn by the tariffs. Real tariffs quote a few thousand ports at most,
+# so larger tariffs repeat ports (inland points, routings) instead of adding new ones.
+PORT_UNIVERSE = 5_000
+SYLLABLES = [consonant + vowel for consonant in 'bcdfghjklmnprstvz' for vowel in 'aeiou']
+
+def synthetic_ports(count, rng):
+    """
+    count distinct ports as (city, code) arrays. Cities are words of two to four
+    syllables, some with a second word, and codes are five uppercase letters.
+    """
+    cities, seen = [], set()
+    while len(cities) < count:
+        words = [''.join(rng.choice(SYLLABLES, rng.integers(2, 5))).title() for _ in range(rng.integers(1, 3))]
+        city = ' '.join(words)
+        if city not in seen:
+            seen.add(city)
+            cities.append(city)
+    letters = np.array(list('ABCDEFGHIJKLMNOPQRSTUVWXYZ'))
+    codes = [''.join(code) for code in letters[rng.integers(0, 26, size=(count, 5))]]
+    return np.array(cities, dtype=object), np.array(codes, dtype=object)
+
+def _misspell(cities, rng, share):
+    """Swap one inner letter in a share of the cities, so they only match fuzzily."""
+    cities = cities.copy()
+    for i in np.flatnonzero(rng.random(len(cities)) < share):
+        city = cities[i]
+        if len(city) > 4:
+            position = rng.integers(1, len(city) - 2)
+            cities[i] = city[:position] + city[position + 1] + city[position] + city[position + 2:]
+    return cities
+
+def synthetic_tariff(provider, rows, ports, rng):
+    """
+    Raw workbook frame of rows lines for a provider key, in the layout its registry
+    entry expects. Destinations are drawn from the shared ports, so providers
+    overlap; the formats, noise and price quirks follow each provider's workbooks.
+    """
+    cities, codes = ports
+    picked = rng.integers(0, len(cities), rows)
+    city, code = _misspell(cities[picked], rng, 0.05), codes[picked]
+    fmt = rng.choice(['paren', 'dash', 'bare'], rows, p={
+        'aires': [0.6, 0.35, 0.05], 'fcl': [0.45, 0.35, 0.2], 'silver': [0.6, 0.05, 0.35]}[provider])
+    destino = np.where(fmt == 'paren', city + ' (' + code + ')',
+                       np.where(fmt == 'dash', city + ' - ' + code, city))
+    base = rng.uniform(800, 6000, rows).round()
+    veinte = base.astype(object)
+    cuarenta = (base * rng.uniform(1.0, 1.4, rows)).round().astype(object)
+
+    missing = rng.random(rows) < 0.05
+    if provider == 'aires':
+        # Currency strings, '*' notes and HAPAG lines, plus lines without prices
+        as_text = rng.random(rows) < 0.3
+        veinte[as_text] = [f'${value:,.0f}' for value in base[as_text]]
+        note = rng.random(rows) < 0.05
+        destino = np.where(note, '*' + destino + ' (via transbordo)', destino)
+        hapag = rng.random(rows) < 0.02
+        destino = np.where(hapag, 'HAPAG: ' + destino, destino)
+        veinte[missing] = np.nan
+        cuarenta[missing] = np.nan
+        return pd.DataFrame({'destino': destino, 'veinte': veinte, 'curenta': cuarenta})
+    if provider == 'silver':
+        # '-' for prices not quoted
+        veinte[missing] = '-'
+        cuarenta[rng.random(rows) < 0.05] = np.nan
+        return pd.DataFrame({'destino': destino, 'veinte': veinte, 'cuarenta': cuarenta})
+    veinte[missing] = np.nan
+    return pd.DataFrame({'destino': destino, 'veinte': veinte, 'cuarenta': cuarenta})
+
+def write_synthetic_workbooks(rows, directory, seed=0, providers=BENCHMARK_PROVIDERS):
+    """Generate one workbook per provider; returns registry entries pointing at them."""
+    rng = np.random.default_rng(seed)
+    ports = synthetic_ports(min(max(rows, 10), PORT_UNIVERSE), rng)
+    by_key = {p['key']: p for p in PROVIDERS}
+    entries = []
+    for key in providers:
+        entry = dict(by_key[key], file=os.path.join(directory, f'{key}_{rows}.xlsx'))
+        synthetic_tariff(key, rows, ports, rng).to_excel(entry['file'], index=False)
+        entries.append(entry)
+    return entries
+
+@contextmanager
+def _stage(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = time.perf_counter() - start
+
+def run_stages(providers, join='destino', caches=False):
+    """
+    Run comparacion.main's stages on the providers' workbooks, writing the outputs under
+    the current directory. With caches, the ingest and match caches are read and filled
+    as in main, so only the first run in a directory parses and scores everything.
+    Returns the seconds per stage and the number of comparison rows.
+    """
+    labels = provider_labels(providers)
+    os.makedirs('data', exist_ok=True)
+    start = time.perf_counter()
+    # One workbook at a time, so the per-workbook stage times add up to the elapsed time
+    frames, reports = ingest_providers(providers, workers=1, use_cache=caches)
+    elapsed = time.perf_counter() - start
+    clean = sum(report['stages'].get('clean', 0) for report in reports)
+    normalize = sum(report['stages'].get('normalize', 0) for report in reports)
+    # Reading and writing the ingest cache count as ingest
+    timings = {'ingest': elapsed - clean - normalize, 'clean': clean, 'normalize': normalize}
+
+    with _stage(timings, 'match'), open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+        # match_destinations logs every fuzzy match; keep the cost, drop the output
+        cache = MatchCache(MATCH_CACHE_FILE, MATCH_THRESHOLD) if caches else None
+        comparison_groups, no_match_groups, _, context = match_providers(frames, labels, join, cache)
+        if cache is not None:
+            cache.close()
+    with _stage(timings, 'aggregate'):
+        comparison_df, no_matches_df, summary_stats, frames = aggregate_results(
+            comparison_groups, no_match_groups, frames, labels)
+    with _stage(timings, 'write'):
+        write_outputs(providers, comparison_df, no_matches_df, summary_stats, frames, context['price_table'])
+        record_history(providers, frames, comparison_df)
+    return timings, len(comparison_df)
+
+def current_commit():
+    """Short hash of HEAD, with a '+' when the working tree has changes, or None outside git."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], capture_output=True,
+                               text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ('+' if dirty else '')
+
+def run_benchmarks(sizes=BENCHMARK_SIZES, repeat=1, join='destino', seed=0, caches=False):
+    """
+    Benchmark every size; the workbooks are generated once per size and not timed.
+    Returns one row per size, repetition and stage.
+    """
+    results = []
+    commit = current_commit()
+    run_at = pd.Timestamp.now().isoformat(timespec='seconds')
+    repo = os.getcwd()
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in sizes:
+            providers = write_synthetic_workbooks(rows, directory, seed)
+            os.chdir(directory)
+            try:
+                for repetition in range(repeat):
+                    timings, compared = run_stages(providers, join, caches)
+                    print(f"{rows} rows: " + ', '.join(f"{stage} {timings[stage]:.3f}s" for stage in STAGES)
+                          + f" ({compared} destinations compared)")
+                    for stage in STAGES:
+                        results.append({'run_at': run_at, 'commit': commit, 'rows': rows, 'join': join,
+                                        'caches': caches, 'repetition': repetition, 'stage': stage, 'seconds': timings[stage],
+                                        'compared': compared, 'python': platform.python_version(),
+                                        'pandas': pd.__version__})
+            finally:
+                os.chdir(repo)
+    return pd.DataFrame(results)
+
+def save_results(results, path=BENCHMARK_RESULTS):
+    """Append benchmark rows to the results CSV."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    results.to_csv(path, mode='a', header=not os.path.exists(path), index=False)
+
+def compare_results(path=BENCHMARK_RESULTS, commits=None, caches=False):
+    """
+    Median seconds per (rows, stage) for each commit, oldest first, with the change
+    of the last commit against the one before it. commits limits the comparison to
+    those commits (default: every commit in the file); caches picks the runs with or
+    without the caches.
+    """
+    results = pd.read_csv(path, dtype={'commit': str})
+    # Rows saved before the caches column are uncached runs
+    if 'caches' not in results.columns:
+        results['caches'] = False
+    results = results[results['caches'].fillna(False).astype(bool) == caches]
+    order = list(dict.fromkeys(results['commit']))
+    if commits is not None:
+        order = [commit for commit in order if commit in commits]
+    table = results[results['commit'].isin(order)].pivot_table(
+        index=['rows', 'stage'], columns='commit', values='seconds', aggfunc='median')
+    table = table[order].reindex(pd.MultiIndex.from_product([sorted(results['rows'].unique()), STAGES]))
+    table = table.dropna(how='all')
+    if len(order) >= 2:
+        table['change_pct'] = (table[order[-1]] / table[order[-2]] - 1) * 100
+    return table
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark the comparison pipeline on synthetic tariffs.')
+    parser.add_argument('--sizes', type=lambda value: [int(size) for size in value.split(',')],
+                        default=BENCHMARK_SIZES, help='Comma separated rows per provider workbook')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per size (the comparison uses the median)')
+    parser.add_argument('--join', choices=['destino', 'port_code'], default='destino')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic tariffs')
+    parser.add_argument('--caches', action='store_true',
+                        help='Use the ingest and match caches as comparacion.py does (default: off)')
+    parser.add_argument('--results', default=BENCHMARK_RESULTS, help='Results CSV, appended to on every run')
+    parser.add_argument('--compare', nargs='*', metavar='COMMIT',
+                        help='Print the stored results per commit instead of running (default: all commits)')
+    args = parser.parse_args()
+
+    if args.compare is not None:
+        with pd.option_context('display.float_format', '{:.3f}'.format, 'display.width', 200):
+            print(compare_results(args.results, args.compare or None, args.caches))
+    else:
+        results = run_benchmarks(args.sizes, args.repeat, args.join, args.seed, args.caches)
+        save_results(results, args.results)
+        print(f"Results appended to '{args.results}' for commit {results['commit'].iloc[0]}")